@@ -2,21 +2,49 @@ from typing import List, Dict, Any
 import re, os
 from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
 from typing import List, Dict, Any
+import hashlib
+import json
 import re
 import os
 from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from dotenv import load_dotenv
 
+from app.storage import get_cached_llm_response, save_llm_response
+
 load_dotenv()
 openai_client = OpenAI(
     api_key=os.getenv("GROQ_API_KEY"),
     base_url="https://api.groq.com/openai/v1"
 )
+# Async twin of openai_client so endpoints can overlap independent LLM calls
+# with asyncio.gather instead of paying their network latency serially
+async_openai_client = AsyncOpenAI(
+    api_key=os.getenv("GROQ_API_KEY"),
+    base_url="https://api.groq.com/openai/v1"
+)
+
+
+def _completion_content(resp) -> str:
+    """Pull the message text out of a chat completion, tolerating shape drift."""
+    try:
+        return resp.choices[0].message.content
+    except Exception:
+        try:
+            return resp.choices[0]["message"]["content"]
+        except Exception:
+            return str(resp)
 
 
 analyzer = SentimentIntensityAnalyzer()
 
+# Optional Aho-Corasick matcher for fast multi-keyword scanning (if installed)
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except Exception:
+    AHOCORASICK_AVAILABLE = False
+
 RISK_KEYWORDS = {
     "self_harm": [
         "kill myself",
@@ -99,72 +127,131 @@ RISK_KEYWORDS = {
 }
 
 
+# Build the keyword matcher once at import so each text is scanned a single time
+# instead of running one re.search per keyword (~60 scans per message).
+if AHOCORASICK_AVAILABLE:
+    RISK_AUTOMATON = ahocorasick.Automaton()
+    for _tag, _patterns in RISK_KEYWORDS.items():
+        for _p in _patterns:
+            RISK_AUTOMATON.add_word(_p, (_tag, _p))
+    RISK_AUTOMATON.make_automaton()
+else:
+    RISK_AUTOMATON = None
+
+# Fallback when pyahocorasick isn't installed: one precompiled alternation per tag.
+# Longest-first ordering lets the alternation engine short-circuit on the most
+# specific phrases before their shorter substrings.
+RISK_PATTERNS = {
+    tag: re.compile(r'\b(?:' + '|'.join(sorted(map(re.escape, kws), key=len, reverse=True)) + r')\b')
+    for tag, kws in RISK_KEYWORDS.items()
+}
+
+# (keyword, is_multiword) pairs per tag so theme matching can use set lookups
+# for exact hits and only substring-scan for multi-word phrases
+MULTIWORD_KEYWORDS = {
+    tag: [(kw, ' ' in kw) for kw in kws] for tag, kws in RISK_KEYWORDS.items()
+}
+
+
 def detect_risk_tags(text: str) -> List[str]:
-    tags = []
-    lowered = text.lower()
-    
-    print(f"DEBUG: Checking text for keyword risks: '{lowered[:200]}...'")
-    
-    for tag, patterns in RISK_KEYWORDS.items():
-        for p in patterns:
-            # Use regex word boundaries to match only complete words/phrases
-            pattern = r'\b' + re.escape(p) + r'\b'
-            if re.search(pattern, lowered):
-                print(f"DEBUG: Keyword match found - Tag: {tag}, Pattern: '{p}', Text contains: '{p}'")
-                tags.append(tag)
+    return _detect_risk_tags_lowered(text.lower())
+
+
+def _detect_risk_tags_lowered(lowered: str) -> List[str]:
+    if RISK_AUTOMATON is not None:
+        tags = set()
+        for end, (tag, keyword) in RISK_AUTOMATON.iter(lowered):
+            if tag in tags:
+                continue
+            # Verify word boundaries by checking neighbor characters
+            start = end - len(keyword) + 1
+            if start > 0 and lowered[start - 1].isalnum():
+                continue
+            if end + 1 < len(lowered) and lowered[end + 1].isalnum():
+                continue
+            tags.add(tag)
+            # every category matched; nothing left to find in the rest of the text
+            if len(tags) == len(RISK_KEYWORDS):
                 break
-    return tags
+        return list(tags)
+
+    # One search per tag: a single combined alternation would consume
+    # overlapping cross-tag hits ("kill myself" swallowing "kill"), silently
+    # dropping categories the automaton path reports.
+    return [tag for tag, pattern in RISK_PATTERNS.items() if pattern.search(lowered)]
 
 def detect_risk_themes(themes: List[str]) -> List[str]:
     """Detect risk categories based on extracted themes using the same RISK_KEYWORDS"""
-    risk_tags = []
     if not themes:
+        return []
+    return _detect_risk_themes_lowered([theme.lower() for theme in themes])
+
+
+def _detect_risk_themes_lowered(themes_lower: List[str]) -> List[str]:
+    risk_tags = []
+    if not themes_lower:
         return risk_tags
-    
-    print(f"DEBUG: Checking themes for risk: {themes}")
-    
-    # Convert themes to lowercase for matching
-    themes_lower = [theme.lower() for theme in themes]
-    
-    # Use the same RISK_KEYWORDS for theme detection
-    for tag, keyword_list in RISK_KEYWORDS.items():
-        for keyword in keyword_list:
-            # Use word boundary matching to avoid false positives
-            # Only match if the keyword is a complete word or phrase, not a substring
-            matches = [theme for theme in themes_lower if keyword == theme or (len(keyword.split()) > 1 and keyword in theme)]
-            if matches:
-                print(f"DEBUG: Theme risk match found - Tag: {tag}, Keyword: '{keyword}', Matched themes: {matches}")
+
+    # Exact matches are O(1) set lookups; only multi-word phrases fall back to
+    # substring scans, so single-word keywords can't false-positive on substrings
+    themes_set = set(themes_lower)
+    for tag, keywords in MULTIWORD_KEYWORDS.items():
+        for keyword, multiword in keywords:
+            if keyword in themes_set or (multiword and any(keyword in t for t in themes_lower)):
                 risk_tags.append(tag)
                 break
-    
+
     return risk_tags
 
-# Basic local analysis using VADER and keyword spotting
+# Exact-match result cache for analyze_risk keyed by a digest of the input, so
+# repeated page snippets from the extension skip VADER + keyword scanning.
+# Keying on the digest (not the text) avoids retaining full page dumps in memory.
+def _llm_cache_key(fn_name: str, model: str, text: str) -> str:
+    """Cache key for LLM responses: function + model + digest of the input text."""
+    return hashlib.blake2b(f"{fn_name}\0{model}\0{text}".encode(), digest_size=16).hexdigest()
+
+
+_ANALYZE_CACHE: Dict[bytes, Dict[str, Any]] = {}
+_ANALYZE_CACHE_MAX = 4096
+
+
 def analyze_risk(text: str, themes: List[str] = None) -> Dict[str, Any]:
+    key = hashlib.blake2b(
+        (text + "\0" + "|".join(themes or [])).encode(), digest_size=16
+    ).digest()
+    cached = _ANALYZE_CACHE.get(key)
+    if cached is not None:
+        return cached
+    result = _analyze_risk(text, themes)
+    if len(_ANALYZE_CACHE) >= _ANALYZE_CACHE_MAX:
+        # drop the oldest entry (insertion order) to bound memory
+        _ANALYZE_CACHE.pop(next(iter(_ANALYZE_CACHE)))
+    _ANALYZE_CACHE[key] = result
+    return result
+
+
+# Basic local analysis using VADER and keyword spotting
+def _analyze_risk(text: str, themes: List[str] = None) -> Dict[str, Any]:
     sent = analyzer.polarity_scores(text)
-    keyword_tags = detect_risk_tags(text)
-    theme_tags = detect_risk_themes(themes) if themes else []
-    
-    # DEBUG: Print what triggered the risk detection
-    if keyword_tags:
-        print(f"DEBUG: Keyword tags detected: {keyword_tags}")
-        print(f"DEBUG: Text analyzed: {text[:200]}...")
-    
-    if theme_tags:
-        print(f"DEBUG: Theme tags detected: {theme_tags}")
-        print(f"DEBUG: Themes analyzed: {themes}")
-    
-    # Combine keyword and theme-based risk tags
-    all_tags = list(set(keyword_tags + theme_tags))
+    # Lowercase inputs once here and hand the lowered forms to both detectors
+    lowered = text.lower()
+    themes_lower = [t.lower() for t in themes] if themes else []
+    keyword_tags = _detect_risk_tags_lowered(lowered)
+    # No point scanning themes when the keywords already hit every category
+    if len(keyword_tags) == len(RISK_KEYWORDS):
+        theme_tags = []
+    else:
+        theme_tags = _detect_risk_themes_lowered(themes_lower)
+
+    # Combine keyword and theme-based risk tags (sorted for deterministic output)
+    all_tags = sorted({*keyword_tags, *theme_tags})
     
     danger = "low"
     
     # Override sentiment for high-risk content
     if all_tags:
         danger = "high"
-        print(f"DEBUG: HIGH RISK DETECTED! All tags: {all_tags}")
-        print(f"DEBUG: Keyword tags: {keyword_tags}, Theme tags: {theme_tags}")
-        
+
         # For self-harm/suicide content, force negative sentiment
         if "self_harm" in all_tags:
             sent["compound"] = min(sent["compound"], -0.8)  # Force very negative
@@ -183,56 +270,139 @@ def analyze_risk(text: str, themes: List[str] = None) -> Dict[str, Any]:
         "danger_level": danger
     }
 
+def analyze_risk_batch(texts: List[str]) -> List[Dict[str, Any]]:
+    """Analyze many texts in one call for aggregation pipelines.
+
+    Binds the scorer and matcher once outside the loop and deduplicates
+    identical texts first, so a day of rows with repeated snippets pays for
+    VADER and the keyword scan once per distinct text.
+    """
+    analyze = analyze_risk
+    unique = {}
+    for t in texts:
+        if t not in unique:
+            unique[t] = analyze(t)
+    return [unique[t] for t in texts]
+
+
+async def analyze_and_extract(messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Run theme extraction and risk analysis for a message batch in one place.
+
+    Joins the message texts exactly once and shares the resulting string (and
+    analyze_risk's single lowercased copy) between the LLM theme call and the
+    keyword/sentiment scan, instead of each caller re-deriving it. The joined
+    text is returned under "text" so callers can reuse it for excerpts or
+    storage without another join.
+    """
+    text = " \n ".join(m.get("text", "") for m in messages)
+    themes = await extract_themes_async(text)
+    # Copy before augmenting: analyze_risk returns the dict stored in its
+    # cache, and attaching "text" here would pin the full page dump there.
+    result = dict(analyze_risk(text, themes))
+    result["themes"] = themes
+    result["text"] = text
+    return result
+
+
+_WS_RE = re.compile(r"\s+")
+
+
 def summarize_conversation(messages: List[Dict[str, Any]]) -> str:
     joined = " ".join(m.get("text", "") for m in messages[-6:])
-    joined = re.sub(r"\s+", " ", joined).strip()
+    joined = _WS_RE.sub(" ", joined).strip()
     if len(joined) > 300:
         return joined[:300] + "..."
     return joined or "No content"
 
 
+_THEMES_SYSTEM_PROMPT = (
+    "You are an AI model analyzing text captured from a browser extension that reads different websites. "
+    "Extract only meaningful conversation themes that would be relevant to understanding a person's mental state or daily activities. "
+    "Filter out technical terms, website navigation elements, login prompts, error messages, and other irrelevant web content. "
+    "Focus on themes related to emotions, relationships, activities, interests, and personal topics. "
+    "IMPORTANT: Respond with ONLY a comma-separated list of 1-5 theme words. Do not include any explanations, introductions, or additional text. "
+    "Example format: happy, school, friends, stress, gaming"
+)
+
+
+def _parse_themes(content: str, top_k: int) -> List[str]:
+    themes = [theme.strip() for theme in content.split(", ") if theme.strip()]
+    return themes[:top_k]
+
+
 def extract_themes(text: str, top_k: int = 5) -> List[str]:
     api_key = os.getenv("GROQ_API_KEY")
     if not api_key:
         return {"error": "No Groq API key configured"}
 
     model = os.environ.get("GROQ_MODEL", "llama-3.1-8b-instant")
-    system_prompt = (
-        "You are an AI model analyzing text captured from a browser extension that reads different websites. "
-        "Extract only meaningful conversation themes that would be relevant to understanding a person's mental state or daily activities. "
-        "Filter out technical terms, website navigation elements, login prompts, error messages, and other irrelevant web content. "
-        "Focus on themes related to emotions, relationships, activities, interests, and personal topics. "
-        "IMPORTANT: Respond with ONLY a comma-separated list of 1-5 theme words. Do not include any explanations, introductions, or additional text. "
-        "Example format: happy, school, friends, stress, gaming"
-    )
 
+    # Re-submitted page snippets are common; skip the API round trip on exact repeats
+    cache_key = _llm_cache_key("extract_themes", model, text)
+    cached = get_cached_llm_response(cache_key)
+    if cached is not None:
+        return _parse_themes(cached, top_k)
 
     resp = openai_client.chat.completions.create(
         model=model,
         messages=[
-            {"role": "system", "content": system_prompt},
+            {"role": "system", "content": _THEMES_SYSTEM_PROMPT},
             {"role": "user", "content": text},
         ],
         max_tokens=300,
     )
-    # Normalize a few possible shapes
+    content = _completion_content(resp)
+
+    if not content:
+        return []
+
     try:
-        content = resp.choices[0].message.content
+        save_llm_response(cache_key, content, model=model)
     except Exception:
-        try:
-            content = resp.choices[0]["message"]["content"]
-        except Exception:
-            try:
-                content = resp["choices"][0]["message"]["content"]
-            except Exception:
-                content = str(resp)
-    
+        pass
+
+    return _parse_themes(content, top_k)
+
+
+async def extract_themes_async(text: str, top_k: int = 5) -> List[str]:
+    """Async variant of extract_themes for use with asyncio.gather."""
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        return {"error": "No Groq API key configured"}
+
+    model = os.environ.get("GROQ_MODEL", "llama-3.1-8b-instant")
+
+    cache_key = _llm_cache_key("extract_themes", model, text)
+    cached = get_cached_llm_response(cache_key)
+    if cached is not None:
+        return _parse_themes(cached, top_k)
+
+    resp = await async_openai_client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": _THEMES_SYSTEM_PROMPT},
+            {"role": "user", "content": text},
+        ],
+        max_tokens=300,
+    )
+    content = _completion_content(resp)
+
     if not content:
         return []
-    
-    # Split themes and clean up
-    themes = [theme.strip() for theme in content.split(", ") if theme.strip()]
-    return themes[:top_k]
+
+    try:
+        save_llm_response(cache_key, content, model=model)
+    except Exception:
+        pass
+
+    return _parse_themes(content, top_k)
+
+
+_SUMMARY_SYSTEM_PROMPT = "You are a helpful assistant that writes concise, parent-friendly daily summaries of conversation trends."
+_SUMMARY_PROMPT = (
+    "Write a short human-readable daily summary using the following aggregated metrics and short excerpts. "
+    "Include top themes, overall sentiment and risk highlights. Keep it under 200 words.\n\n"
+)
 
 
 def uplevel_summary_with_llm(aggregated: Dict[str, Any], excerpts: List[str], user_id: str = None) -> str:
@@ -245,33 +415,69 @@ def uplevel_summary_with_llm(aggregated: Dict[str, Any], excerpts: List[str], us
         raise RuntimeError("No OpenAI/Groq API key configured")
 
     model = os.environ.get("GROQ_MODEL", "gpt-3.5-turbo")
-    system = "You are a helpful assistant that writes concise, parent-friendly daily summaries of conversation trends."
-    prompt = (
-        "Write a short human-readable daily summary using the following aggregated metrics and short excerpts. "
-        "Include top themes, overall sentiment and risk highlights. Keep it under 200 words.\n\n"
+    body = f"Aggregated: {aggregated}\n\nExcerpts:\n" + "\n".join(f"- {e}" for e in excerpts[:6])
+
+    cache_key = _llm_cache_key("uplevel_summary", model, body)
+    cached = get_cached_llm_response(cache_key)
+    if cached is not None:
+        return cached
+
+    resp = openai_client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": _SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": _SUMMARY_PROMPT + body},
+        ],
+        max_tokens=300,
     )
+    content = _completion_content(resp)
+    try:
+        save_llm_response(cache_key, content, model=model)
+    except Exception:
+        pass
+    return content
+
+
+async def uplevel_summary_with_llm_async(aggregated: Dict[str, Any], excerpts: List[str], user_id: str = None) -> str:
+    """Async variant of uplevel_summary_with_llm for use with asyncio.gather."""
+    api_key = os.getenv("GROQ_API_KEY") or os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise RuntimeError("No OpenAI/Groq API key configured")
+
+    model = os.environ.get("GROQ_MODEL", "gpt-3.5-turbo")
     body = f"Aggregated: {aggregated}\n\nExcerpts:\n" + "\n".join(f"- {e}" for e in excerpts[:6])
 
+    cache_key = _llm_cache_key("uplevel_summary", model, body)
+    cached = get_cached_llm_response(cache_key)
+    if cached is not None:
+        return cached
+
+    resp = await async_openai_client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": _SUMMARY_SYSTEM_PROMPT},
+            {"role": "user", "content": _SUMMARY_PROMPT + body},
+        ],
+        max_tokens=300,
+    )
+    content = _completion_content(resp)
     try:
-        resp = openai_client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": system},
-                {"role": "user", "content": prompt + body},
-            ],
-            max_tokens=300,
-        )
-        # multiple possible shapes
-        try:
-            content = resp.choices[0].message.content
-        except Exception:
-            try:
-                content = resp.choices[0]["message"]["content"]
-            except Exception:
-                content = str(resp)
-        return content
-    except Exception as e:
-        raise
+        save_llm_response(cache_key, content, model=model)
+    except Exception:
+        pass
+    return content
+
+
+_MHA_SYSTEM_PROMPT = (
+    "You are a clinical-adjacent assistant that writes concise, actionable mental-health assessments for a parent or caregiver. "
+    "Be empathetic, non-judgmental, and include clear next steps and emergency instructions if severe risk is detected."
+)
+_MHA_PROMPT = (
+    "Given the following aggregated conversation metrics and sample excerpts, produce:\n"
+    "1) A short assessment (2-4 sentences) of the user's mental state. Your tone should be similar to a therapist speaking to a client's caregiver. \n"
+    "2) Risk level summary (mention self-harm/suicidal/violence flags if present).\n"
+    "3) Concrete recommended next steps for a caregiver, including when to seek emergency help.\n\n"
+)
 
 
 def uplevel_mental_health_assessment(aggregated: Dict[str, Any], excerpts: List[str], user_id: str = None) -> str:
@@ -285,35 +491,120 @@ def uplevel_mental_health_assessment(aggregated: Dict[str, Any], excerpts: List[
         raise RuntimeError("No OpenAI/Groq API key configured")
 
     model = os.environ.get("GROQ_MODEL", "gpt-4o")
-    system = (
-        "You are a clinical-adjacent assistant that writes concise, actionable mental-health assessments for a parent or caregiver. "
-        "Be empathetic, non-judgmental, and include clear next steps and emergency instructions if severe risk is detected."
-    )
-
-    prompt = (
-        "Given the following aggregated conversation metrics and sample excerpts, produce:\n"
-        "1) A short assessment (2-4 sentences) of the user's mental state. Your tone should be similar to a therapist speaking to a client's caregiver. \n"
-        "2) Risk level summary (mention self-harm/suicidal/violence flags if present).\n"
-        "3) Concrete recommended next steps for a caregiver, including when to seek emergency help.\n\n"
-    )
-
     body = f"Aggregated: {aggregated}\n\nExcerpts:\n" + "\n".join(f"- {e}" for e in excerpts[:6])
 
+    cache_key = _llm_cache_key("mental_health_assessment", model, body)
+    cached = get_cached_llm_response(cache_key)
+    if cached is not None:
+        return cached
+
     resp = openai_client.chat.completions.create(
         model=model,
         messages=[
-            {"role": "system", "content": system},
-            {"role": "user", "content": prompt + body},
+            {"role": "system", "content": _MHA_SYSTEM_PROMPT},
+            {"role": "user", "content": _MHA_PROMPT + body},
         ],
         max_tokens=400,
     )
 
+    content = _completion_content(resp)
     try:
-        content = resp.choices[0].message.content
+        save_llm_response(cache_key, content, model=model)
     except Exception:
+        pass
+    return content
+
+
+_MHA_BATCH_PROMPT = (
+    "You will receive aggregated conversation metrics for several users as a JSON object "
+    "keyed by user id. For EACH user, produce the assessment described below.\n"
+    "Respond with ONLY a JSON object mapping each user id to its assessment text "
+    "(a single string per user, markdown allowed), no other commentary.\n\n"
+    "Per-user assessment:\n" + _MHA_PROMPT
+)
+
+
+async def uplevel_mental_health_assessment_batch_async(per_user: Dict[str, Dict[str, Any]]) -> Dict[str, str]:
+    """Assess several users in one LLM round trip.
+
+    per_user maps user_id -> aggregated metrics (as passed to
+    uplevel_mental_health_assessment). One chat completion covers the whole
+    batch and the response is parsed as a user_id -> assessment JSON object,
+    amortizing the per-call network latency across users. Groq does not expose
+    OpenAI's asynchronous /v1/batches endpoint, so batching happens at the
+    prompt level instead.
+    """
+    api_key = os.getenv("GROQ_API_KEY") or os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise RuntimeError("No OpenAI/Groq API key configured")
+
+    model = os.environ.get("GROQ_MODEL", "gpt-4o")
+    body = json.dumps(per_user, sort_keys=True, default=str)
+
+    cache_key = _llm_cache_key("mental_health_assessment_batch", model, body)
+    parsed = None
+    cached = get_cached_llm_response(cache_key)
+    if cached is not None:
         try:
-            content = resp.choices[0]["message"]["content"]
+            parsed = json.loads(cached)
         except Exception:
-            content = str(resp)
+            # entry written before parse validation existed; recompute
+            parsed = None
+
+    if not isinstance(parsed, dict):
+        resp = await async_openai_client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": _MHA_SYSTEM_PROMPT},
+                {"role": "user", "content": _MHA_BATCH_PROMPT + body},
+            ],
+            max_tokens=400 * max(len(per_user), 1),
+            response_format={"type": "json_object"},
+        )
+        content = _completion_content(resp)
+        try:
+            parsed = json.loads(content)
+        except Exception:
+            raise RuntimeError("Batch assessment response was not valid JSON")
+        if not isinstance(parsed, dict):
+            raise RuntimeError("Batch assessment response was not a JSON object")
+        # Only cache once the JSON parses: a truncated response written to
+        # the durable llm_cache would poison every retry for these aggregates
+        try:
+            save_llm_response(cache_key, content, model=model)
+        except Exception:
+            pass
+
+    return {uid: str(parsed.get(uid, "")) for uid in per_user}
+
+
+async def uplevel_mental_health_assessment_async(aggregated: Dict[str, Any], excerpts: List[str], user_id: str = None) -> str:
+    """Async variant of uplevel_mental_health_assessment for use with asyncio.gather."""
+    api_key = os.getenv("GROQ_API_KEY") or os.getenv("OPENAI_API_KEY")
+    if not api_key:
+        raise RuntimeError("No OpenAI/Groq API key configured")
+
+    model = os.environ.get("GROQ_MODEL", "gpt-4o")
+    body = f"Aggregated: {aggregated}\n\nExcerpts:\n" + "\n".join(f"- {e}" for e in excerpts[:6])
+
+    cache_key = _llm_cache_key("mental_health_assessment", model, body)
+    cached = get_cached_llm_response(cache_key)
+    if cached is not None:
+        return cached
+
+    resp = await async_openai_client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": _MHA_SYSTEM_PROMPT},
+            {"role": "user", "content": _MHA_PROMPT + body},
+        ],
+        max_tokens=400,
+    )
+
+    content = _completion_content(resp)
+    try:
+        save_llm_response(cache_key, content, model=model)
+    except Exception:
+        pass
     return content
 
@@ -3,10 +3,34 @@ from typing import Optional
 from fastapi import Depends, HTTPException
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import os
+import time
 import jwt
 
 SECRET = os.environ.get('JWT_SECRET', 'dev-secret-change-me')
 ALGORITHM = os.environ.get('JWT_ALGORITHM', 'HS256')
+# jwt.decode re-parses the algorithms argument on every call; build it once
+_ALGORITHMS = [ALGORITHM]
+
+# Verified-token cache: JWT verify runs on every request and the extension
+# reuses the same bearer for hours. Entries are valid until the token's own exp.
+_TOKEN_CACHE = {}
+_TOKEN_CACHE_MAX = 1024
+
+
+def _decode_token(token: str):
+    payload = _TOKEN_CACHE.get(token)
+    if payload is not None:
+        # exp is optional in JWTs; a cached token without one never expires
+        exp = payload.get('exp')
+        if exp is None or exp > time.time():
+            return payload
+        _TOKEN_CACHE.pop(token, None)
+        raise jwt.ExpiredSignatureError('Signature has expired')
+    payload = jwt.decode(token, SECRET, algorithms=_ALGORITHMS)
+    if len(_TOKEN_CACHE) >= _TOKEN_CACHE_MAX:
+        _TOKEN_CACHE.pop(next(iter(_TOKEN_CACHE)))
+    _TOKEN_CACHE[token] = payload
+    return payload
 
 security = HTTPBearer()
 # A non-fatal bearer that doesn't raise if no header is present
@@ -20,17 +44,14 @@ def create_jwt(sub: str, expires_minutes: int = 60):
 def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
     token = credentials.credentials
     try:
-        payload = jwt.decode(token, SECRET, algorithms=[ALGORITHM])
+        payload = _decode_token(token)
         user_id = payload.get('sub')
         if not user_id:
-            print("DEBUG: No user_id in token payload") # DEBUG
             raise HTTPException(status_code=401, detail='Invalid token payload')
         return {'user_id': user_id}
     except jwt.ExpiredSignatureError:
-        print("DEBUG: Token expired") # DEBUG
         raise HTTPException(status_code=401, detail='Token expired')
-    except jwt.InvalidTokenError as e:
-        print(f"DEBUG: Invalid token error: {e}") # DEBUG
+    except jwt.InvalidTokenError:
         raise HTTPException(status_code=401, detail='Invalid token')
 
 
@@ -40,7 +61,7 @@ def get_current_user_optional(credentials: Optional[HTTPAuthorizationCredentials
         return None
     token = credentials.credentials
     try:
-        payload = jwt.decode(token, SECRET, algorithms=[ALGORITHM])
+        payload = _decode_token(token)
         user_id = payload.get('sub')
         if not user_id:
             return None
@@ -1,83 +1,152 @@
 import os
 import sqlite3
 import json
+import threading
 from typing import List
 from datetime import datetime
 
+# C-accelerated JSON when available; every row read/write does 3-4 (de)serializations
+try:
+    import orjson
+
+    def _dumps(obj) -> str:
+        return orjson.dumps(obj).decode()
+
+    _loads = orjson.loads
+except ImportError:
+    _dumps = json.dumps
+    _loads = json.loads
+
 DB_PATH = os.path.join(os.path.dirname(__file__), "..", "themes.db")
 
+# One connection per thread, opened lazily and reused: opening a fresh
+# sqlite3.connect per call pays file-open + journal setup on every operation.
+_local = threading.local()
 
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
+
+_init_lock = threading.Lock()
+_init_done = False
+
+_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS themes (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    themes_json TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS analyses (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT,
+    ts TEXT NOT NULL,
+    date TEXT,
+    message_text TEXT,
+    sentiment_json TEXT,
+    sent_neg REAL,
+    sent_neu REAL,
+    sent_pos REAL,
+    sent_compound REAL,
+    risk_tags_json TEXT,
+    danger_level TEXT,
+    themes_json TEXT
+);
+
+CREATE TABLE IF NOT EXISTS llm_cache (
+    hash TEXT PRIMARY KEY,
+    response TEXT NOT NULL,
+    model TEXT,
+    created_at TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS daily_summaries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    themes_json TEXT,
+    avg_sentiment_json TEXT,
+    risk_counts_json TEXT,
+    danger_summary TEXT,
+    summary_text TEXT,
+    created_at TEXT NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS idx_analyses_user_ts ON analyses(user_id, ts);
+CREATE INDEX IF NOT EXISTS idx_analyses_ts ON analyses(ts);
+CREATE INDEX IF NOT EXISTS idx_analyses_user_date ON analyses(user_id, date);
+CREATE INDEX IF NOT EXISTS idx_analyses_date ON analyses(date);
+CREATE INDEX IF NOT EXISTS idx_daily_user_date ON daily_summaries(user_id, date);
+CREATE INDEX IF NOT EXISTS idx_themes_user ON themes(user_id);
+"""
+
+
+def _conn():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        _local.conn = conn
+        _ensure_init(conn)
+    return conn
+
+
+def _ensure_init(conn):
+    """Create the schema once per process, on first connection use.
+
+    Running this lazily keeps DDL and migrations off module import, which
+    matters for worker cold start (and avoids racy init under preload+fork).
+    """
+    global _init_done
+    if _init_done:
+        return
+    with _init_lock:
+        if _init_done:
+            return
+        conn.executescript(_SCHEMA_SQL)
+        _migrate_analyses(conn)
+        _init_done = True
+
+
+def _migrate_analyses(conn):
+    # If the analyses table predates the themes_json/date/sent_* columns, add them
     cur = conn.cursor()
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS themes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT NOT NULL,
-            date TEXT NOT NULL,
-            themes_json TEXT NOT NULL
-        )
-        """
-    )
-    # per-message analyses
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS analyses (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT,
-            ts TEXT NOT NULL,
-            message_text TEXT,
-            sentiment_json TEXT,
-            risk_tags_json TEXT,
-            danger_level TEXT,
-            themes_json TEXT
-        )
-        """
-    )
-    # If the analyses table existed before this code added themes_json, ensure the column exists
     try:
         cur.execute("PRAGMA table_info(analyses)")
         cols = [r[1] for r in cur.fetchall()]
-        if "themes_json" not in cols:
-            try:
-                cur.execute("ALTER TABLE analyses ADD COLUMN themes_json TEXT")
-            except Exception:
-                # best-effort; ignore if unable to alter (older SQLite versions)
-                pass
+        for col, coltype in (
+            ("themes_json", "TEXT"),
+            ("date", "TEXT"),
+            ("sent_neg", "REAL"),
+            ("sent_neu", "REAL"),
+            ("sent_pos", "REAL"),
+            ("sent_compound", "REAL"),
+        ):
+            if col not in cols:
+                try:
+                    cur.execute(f"ALTER TABLE analyses ADD COLUMN {col} {coltype}")
+                except Exception:
+                    # best-effort; ignore if unable to alter (older SQLite versions)
+                    pass
+        # backfill the date column from existing ISO timestamps
+        cur.execute("UPDATE analyses SET date = substr(ts, 1, 10) WHERE date IS NULL")
     except Exception:
         # ignore any pragma errors
         pass
 
-    # per-day aggregated summaries
-    cur.execute(
-        """
-        CREATE TABLE IF NOT EXISTS daily_summaries (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id TEXT NOT NULL,
-            date TEXT NOT NULL,
-            themes_json TEXT,
-            avg_sentiment_json TEXT,
-            risk_counts_json TEXT,
-            danger_summary TEXT,
-            summary_text TEXT,
-            created_at TEXT NOT NULL
-        )
-        """
-    )
-    conn.commit()
-    conn.close()
+
+def init_db():
+    # kept for callers that want to force initialization eagerly
+    _conn()
 
 
 def save_user_themes(user_id: str, themes: List[str]):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
+    cur = _conn().cursor()
     cur.execute(
         "INSERT INTO themes (user_id, date, themes_json) VALUES (?, ?, ?)",
-        (user_id, datetime.utcnow().isoformat(), json.dumps(themes)),
+        (user_id, datetime.utcnow().isoformat(), _dumps(themes)),
     )
-    conn.commit()
-    conn.close()
 
 
 def save_analysis(user_id: str, message_text: str, analysis: dict, ts: str = None, themes: List[str] = None):
@@ -85,156 +154,282 @@ def save_analysis(user_id: str, message_text: str, analysis: dict, ts: str = Non
     Stored fields include ts, user_id, message_text, sentiment_json, risk_tags_json, danger_level, themes_json.
     """
     ts = ts or datetime.utcnow().isoformat()
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
+    sentiment = analysis.get("sentiment") or {}
+    cur = _conn().cursor()
     cur.execute(
-        "INSERT INTO analyses (user_id, ts, message_text, sentiment_json, risk_tags_json, danger_level, themes_json) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        "INSERT INTO analyses (user_id, ts, date, message_text, sentiment_json, sent_neg, sent_neu, sent_pos, sent_compound, risk_tags_json, danger_level, themes_json) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
         (
             user_id,
             ts,
+            ts[:10],
             message_text,
-            json.dumps(analysis.get("sentiment")),
-            json.dumps(analysis.get("risk_tags")),
+            _dumps(analysis.get("sentiment")),
+            sentiment.get("neg"),
+            sentiment.get("neu"),
+            sentiment.get("pos"),
+            sentiment.get("compound"),
+            _dumps(analysis.get("risk_tags")),
             analysis.get("danger_level"),
-            json.dumps(themes) if themes is not None else None,
+            _dumps(themes) if themes is not None else None,
         ),
     )
-    conn.commit()
-    conn.close()
 
 
-def get_analyses_for_user_date(user_id: str, date_str: str):
-    """Return analyses for a user where ts starts with date_str (YYYY-MM-DD)."""
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    like_pattern = f"{date_str}%"
-    cur.execute(
-        "SELECT ts, message_text, sentiment_json, risk_tags_json, danger_level, themes_json FROM analyses WHERE user_id = ? AND ts LIKE ? ORDER BY id ASC",
-        (user_id, like_pattern),
-    )
-    rows = cur.fetchall()
-    conn.close()
-    results = []
-    for r in rows:
+def save_analysis_and_themes(user_id: str, message_text: str, analysis: dict, ts: str = None, themes: List[str] = None):
+    """Persist the analysis row and the per-user themes row in one transaction.
+
+    /analyze writes both on every request; a single BEGIN/COMMIT pays one
+    fsync instead of two and keeps the rows atomic (either both land or
+    neither does).
+    """
+    ts = ts or datetime.utcnow().isoformat()
+    sentiment = analysis.get("sentiment") or {}
+    conn = _conn()
+    conn.execute("BEGIN")
+    try:
+        conn.execute(
+            "INSERT INTO analyses (user_id, ts, date, message_text, sentiment_json, sent_neg, sent_neu, sent_pos, sent_compound, risk_tags_json, danger_level, themes_json) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                user_id,
+                ts,
+                ts[:10],
+                message_text,
+                _dumps(analysis.get("sentiment")),
+                sentiment.get("neg"),
+                sentiment.get("neu"),
+                sentiment.get("pos"),
+                sentiment.get("compound"),
+                _dumps(analysis.get("risk_tags")),
+                analysis.get("danger_level"),
+                _dumps(themes) if themes is not None else None,
+            ),
+        )
+        if themes is not None:
+            conn.execute(
+                "INSERT INTO themes (user_id, date, themes_json) VALUES (?, ?, ?)",
+                (user_id, ts, _dumps(themes)),
+            )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+def save_analyses_bulk(items: List[dict]):
+    """Insert many analysis rows in one transaction.
+
+    Each item is a dict with user_id, analysis, and optional message_text, ts,
+    themes (same meaning as save_analysis). One BEGIN/COMMIT amortizes the
+    per-commit fsync that dominates many small inserts.
+    """
+    if not items:
+        return
+    rows = []
+    for it in items:
+        ts = it.get("ts") or datetime.utcnow().isoformat()
+        analysis = it.get("analysis") or {}
+        sentiment = analysis.get("sentiment") or {}
+        themes = it.get("themes")
+        rows.append((
+            it.get("user_id"),
+            ts,
+            ts[:10],
+            it.get("message_text"),
+            _dumps(analysis.get("sentiment")),
+            sentiment.get("neg"),
+            sentiment.get("neu"),
+            sentiment.get("pos"),
+            sentiment.get("compound"),
+            _dumps(analysis.get("risk_tags")),
+            analysis.get("danger_level"),
+            _dumps(themes) if themes is not None else None,
+        ))
+    conn = _conn()
+    conn.execute("BEGIN")
+    try:
+        conn.executemany(
+            "INSERT INTO analyses (user_id, ts, date, message_text, sentiment_json, sent_neg, sent_neu, sent_pos, sent_compound, risk_tags_json, danger_level, themes_json) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows,
+        )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+
+
+_ANALYSIS_COLUMNS = "ts, message_text, sentiment_json, risk_tags_json, danger_level, themes_json, sent_neg, sent_neu, sent_pos, sent_compound"
+
+
+def _row_to_analysis(r):
+    # prefer the materialized sentiment columns; fall back to legacy JSON rows
+    if r[9] is not None:
+        sent = {"neg": r[6], "neu": r[7], "pos": r[8], "compound": r[9]}
+    else:
         try:
-            sent = json.loads(r[2]) if r[2] else None
+            sent = _loads(r[2]) if r[2] else None
         except Exception:
             sent = None
-        try:
-            tags = json.loads(r[3]) if r[3] else []
-        except Exception:
-            tags = []
-        try:
-            themes = json.loads(r[5]) if r[5] else []
-        except Exception:
-            themes = []
-        results.append({
-            "ts": r[0],
-            "text": r[1],
-            "sentiment": sent,
-            "risk_tags": tags,
-            "danger_level": r[4],
-            "themes": themes,
-        })
-    return results
+    try:
+        tags = _loads(r[3]) if r[3] else []
+    except Exception:
+        tags = []
+    try:
+        themes = _loads(r[5]) if r[5] else []
+    except Exception:
+        themes = []
+    return {
+        "ts": r[0],
+        "text": r[1],
+        "sentiment": sent,
+        "risk_tags": tags,
+        "danger_level": r[4],
+        "themes": themes,
+    }
+
+
+def iter_analyses_for_user_date(user_id: str, date_str: str):
+    """Yield parsed analyses for a user on the given date (YYYY-MM-DD) one row
+    at a time, so large days can be aggregated without materializing a list."""
+    cur = _conn().cursor()
+    cur.execute(
+        f"SELECT {_ANALYSIS_COLUMNS} FROM analyses WHERE user_id = ? AND date = ? ORDER BY id ASC",
+        (user_id, date_str),
+    )
+    for r in cur:
+        yield _row_to_analysis(r)
+
+
+def get_analyses_for_user_date(user_id: str, date_str: str):
+    """Return analyses for a user on the given date (YYYY-MM-DD)."""
+    return list(iter_analyses_for_user_date(user_id, date_str))
 
 
 def get_user_ids_for_date(date_str: str):
-    """Return distinct user_ids that have analyses for the given date prefix (YYYY-MM-DD)."""
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
-    like_pattern = f"{date_str}%"
-    cur.execute("SELECT DISTINCT user_id FROM analyses WHERE ts LIKE ?", (like_pattern,))
+    """Return distinct user_ids that have analyses for the given date (YYYY-MM-DD)."""
+    cur = _conn().cursor()
+    cur.execute("SELECT DISTINCT user_id FROM analyses WHERE date = ?", (date_str,))
     rows = cur.fetchall()
-    conn.close()
     return [r[0] for r in rows if r[0]]
 
 
-def get_analyses_for_user(user_id: str):
-    """Return all analyses for a user ordered by id asc."""
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
+def avg_sentiment_for_user_date(user_id: str, date_str: str):
+    """Average sentiment for a user/date computed natively in SQL from the
+    materialized columns (no per-row JSON parsing)."""
+    cur = _conn().cursor()
     cur.execute(
-        "SELECT ts, message_text, sentiment_json, risk_tags_json, danger_level, themes_json FROM analyses WHERE user_id = ? ORDER BY id ASC",
+        "SELECT AVG(sent_neg), AVG(sent_neu), AVG(sent_pos), AVG(sent_compound) FROM analyses WHERE user_id = ? AND date = ?",
+        (user_id, date_str),
+    )
+    row = cur.fetchone()
+    return {"neg": row[0], "neu": row[1], "pos": row[2], "compound": row[3]}
+
+
+def get_aggregates_for_user_date(user_id: str, date_str: str = None):
+    """Aggregate a user's analyses natively in SQL.
+
+    Returns {"themes": {...}, "risk_counts": {...}, "avg_compound": float|None,
+    "count": int}. Theme and risk tag counts come from GROUP BY over
+    json_each on the stored JSON arrays, so only the aggregate rows cross the
+    driver instead of every analysis. If date_str is None, aggregates over
+    the user's full history.
+    """
+    conn = _conn()
+    where = "user_id = ?"
+    params = (user_id,)
+    if date_str is not None:
+        where += " AND date = ?"
+        params = (user_id, date_str)
+
+    row = conn.execute(
+        f"SELECT COUNT(*), AVG(COALESCE(sent_compound, json_extract(sentiment_json, '$.compound'))) FROM analyses WHERE {where}",
+        params,
+    ).fetchone()
+    count, avg_compound = row[0], row[1]
+
+    themes = dict(conn.execute(
+        f"SELECT je.value, COUNT(*) FROM analyses, json_each(analyses.themes_json) je WHERE {where} GROUP BY je.value",
+        params,
+    ).fetchall())
+
+    risk_counts = dict(conn.execute(
+        f"SELECT je.value, COUNT(*) FROM analyses, json_each(analyses.risk_tags_json) je WHERE {where} GROUP BY je.value",
+        params,
+    ).fetchall())
+
+    return {"themes": themes, "risk_counts": risk_counts, "avg_compound": avg_compound, "count": count}
+
+
+def iter_analyses_for_user(user_id: str):
+    """Yield all parsed analyses for a user ordered by id asc."""
+    cur = _conn().cursor()
+    cur.execute(
+        f"SELECT {_ANALYSIS_COLUMNS} FROM analyses WHERE user_id = ? ORDER BY id ASC",
         (user_id,),
     )
-    rows = cur.fetchall()
-    conn.close()
-    results = []
-    for r in rows:
-        try:
-            sent = json.loads(r[2]) if r[2] else None
-        except Exception:
-            sent = None
-        try:
-            tags = json.loads(r[3]) if r[3] else []
-        except Exception:
-            tags = []
-        try:
-            themes = json.loads(r[5]) if r[5] else []
-        except Exception:
-            themes = []
-        results.append({
-            "ts": r[0],
-            "text": r[1],
-            "sentiment": sent,
-            "risk_tags": tags,
-            "danger_level": r[4],
-            "themes": themes,
-        })
-    return results
+    for r in cur:
+        yield _row_to_analysis(r)
+
+
+def get_analyses_for_user(user_id: str):
+    """Return all analyses for a user ordered by id asc."""
+    return list(iter_analyses_for_user(user_id))
 
 
 def save_daily_summary(user_id: str, date_str: str, themes: List[str], avg_sentiment: dict, risk_counts: dict, danger_summary: str, summary_text: str = None):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
+    cur = _conn().cursor()
     cur.execute(
         "INSERT INTO daily_summaries (user_id, date, themes_json, avg_sentiment_json, risk_counts_json, danger_summary, summary_text, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
         (
             user_id,
             date_str,
-            json.dumps(themes),
-            json.dumps(avg_sentiment),
-            json.dumps(risk_counts),
+            _dumps(themes),
+            _dumps(avg_sentiment),
+            _dumps(risk_counts),
             danger_summary,
             summary_text,
             datetime.utcnow().isoformat(),
         ),
     )
-    conn.commit()
-    conn.close()
 
 
 def get_daily_summary(user_id: str, date_str: str):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
+    cur = _conn().cursor()
     cur.execute(
         "SELECT date, themes_json, avg_sentiment_json, risk_counts_json, danger_summary, summary_text, created_at FROM daily_summaries WHERE user_id = ? AND date = ? ORDER BY id DESC LIMIT 1",
         (user_id, date_str),
     )
     row = cur.fetchone()
-    conn.close()
     if not row:
         return None
     return {
         "date": row[0],
-        "themes": json.loads(row[1]) if row[1] else [],
-        "avg_sentiment": json.loads(row[2]) if row[2] else None,
-        "risk_counts": json.loads(row[3]) if row[3] else {},
+        "themes": _loads(row[1]) if row[1] else [],
+        "avg_sentiment": _loads(row[2]) if row[2] else None,
+        "risk_counts": _loads(row[3]) if row[3] else {},
         "danger_summary": row[4],
         "summary_text": row[5],
         "created_at": row[6],
     }
 
 
+def get_cached_llm_response(cache_key: str):
+    """Return a previously cached LLM response for cache_key, or None."""
+    cur = _conn().cursor()
+    cur.execute("SELECT response FROM llm_cache WHERE hash = ?", (cache_key,))
+    row = cur.fetchone()
+    return row[0] if row else None
+
+
+def save_llm_response(cache_key: str, response: str, model: str = None):
+    cur = _conn().cursor()
+    cur.execute(
+        "INSERT OR REPLACE INTO llm_cache (hash, response, model, created_at) VALUES (?, ?, ?, ?)",
+        (cache_key, response, model, datetime.utcnow().isoformat()),
+    )
+
+
 def get_user_themes(user_id: str):
-    conn = sqlite3.connect(DB_PATH)
-    cur = conn.cursor()
+    cur = _conn().cursor()
     cur.execute("SELECT date, themes_json FROM themes WHERE user_id = ? ORDER BY id DESC", (user_id,))
     rows = cur.fetchall()
-    conn.close()
-    return [{"date": r[0], "themes": json.loads(r[1])} for r in rows]
-
-
-# Ensure DB initialized
-init_db()
+    return [{"date": r[0], "themes": _loads(r[1])} for r in rows]
@@ -1,45 +1,97 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import Body, HTTPException, Query, Depends, Request
+from fastapi.middleware.gzip import GZipMiddleware
+
+# orjson encodes responses several times faster than stdlib json; fall back
+# to the default JSONResponse when it isn't installed (mirrors app.storage).
+# A local subclass is used instead of fastapi's ORJSONResponse, which newer
+# FastAPI releases deprecate with a per-request warning.
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+
+    class _DefaultResponse(JSONResponse):
+        def render(self, content) -> bytes:
+            return orjson.dumps(content)
+except ImportError:
+    orjson = None
+    _DefaultResponse = JSONResponse
+from fastapi import BackgroundTasks, Body, HTTPException, Query, Depends, Request
 from typing import List, Dict, Any
+from collections import Counter
+from contextlib import asynccontextmanager
+import asyncio
+import functools
+import hashlib
+import logging
 import re
 import os
+import time
 from datetime import datetime, timezone
+from html import escape
+from string import Template
 
+import httpx
 
-# Helper: convert markdown bold (**text**) to HTML <strong> tags
-def _md_bold_to_html(s: str) -> str:
-    if not s:
-        return s
-    return re.sub(r"\*\*(.+?)\*\*", r"<strong>\1</strong>", s)
 
+# Compiled once: runs on every assessment/email request over possibly-long LLM text.
+# One alternation covers **bold**, blank lines (paragraph breaks) and single newlines.
+_MD_COMBINED_RE = re.compile(r"\*\*(.+?)\*\*|\n{2,}|\n")
 
-# Helper: remove markdown bold markers for plaintext fallback
-def _md_bold_to_plain(s: str) -> str:
-    if not s:
-        return s
-    return re.sub(r"\*\*(.+?)\*\*", r"\1", s)
 
+def _render_assessment(s: str):
+    """Render LLM markdown-ish text into (html, plain) in a single pass.
 
-def _nl_to_html_paragraphs(s: str) -> str:
-    """Turn double-newlines into <p>...</p> blocks and single newlines into <br> inside paragraphs."""
-    if not s:
-        return s
-    parts = [p.strip() for p in s.split('\n\n') if p.strip()]
-    html_parts = []
-    for p in parts:
-        # replace single newlines with <br>
-        p_html = p.replace('\n', '<br>')
-        html_parts.append(f"<p>{p_html}</p>")
-    return '\n'.join(html_parts)
-
-
-def _nl_to_plain(s: str) -> str:
-    """Normalize whitespace/newlines for plain-text fallback: collapse multiple blank lines to one."""
+    **text** becomes <strong>, blank lines start a new <p> block, and single
+    newlines become <br>; the plain variant drops the bold markers and
+    collapses runs of blank lines.
+    """
     if not s:
-        return s
-    # collapse sequences of 2+ newlines into exactly two
-    return re.sub(r"\n{2,}", "\n\n", s).strip()
+        return s, s
+    html_parts = ["<p>"]
+    plain_parts = []
+    pos = 0
+    for m in _MD_COMBINED_RE.finditer(s):
+        literal = s[pos:m.start()]
+        html_parts.append(literal)
+        plain_parts.append(literal)
+        bold = m.group(1)
+        if bold is not None:
+            html_parts.append(f"<strong>{bold}</strong>")
+            plain_parts.append(bold)
+        elif len(m.group(0)) > 1:
+            # blank line: close the paragraph
+            html_parts.append("</p>\n<p>")
+            plain_parts.append("\n\n")
+        else:
+            html_parts.append("<br>")
+            plain_parts.append("\n")
+        pos = m.end()
+    tail = s[pos:]
+    html_parts.append(tail)
+    plain_parts.append(tail)
+    html_parts.append("</p>")
+    return "".join(html_parts), "".join(plain_parts).strip()
+
+
+# Sentence matcher for alert excerpts, compiled once at import. Matching runs
+# of non-terminator characters (instead of splitting on [.!?]+) never yields
+# the empty chunks that delimiter-only runs produce under re.split.
+_SENT_RE = re.compile(r"[^.!?]+")
+
+
+@functools.lru_cache(maxsize=64)
+def _combined_risk_pattern(tags: frozenset):
+    """One compiled alternation covering every keyword of the given tag set.
+
+    Cached per distinct tag combination so repeat alerts scan each sentence
+    with a single C-level search instead of one search per tag.
+    """
+    keywords = [kw for tag in tags for kw in RISK_KEYWORDS[tag]]
+    return re.compile(
+        r'\b(?:' + '|'.join(sorted(map(re.escape, keywords), key=len, reverse=True)) + r')\b'
+    )
 
 
 def _extract_risk_sentences(text: str, risk_tags: List[str]) -> str:
@@ -47,34 +99,34 @@ def _extract_risk_sentences(text: str, risk_tags: List[str]) -> str:
     if not text or not risk_tags:
         return text[:400]  # fallback to original behavior
     
-    # Import RISK_KEYWORDS from analysis module
-    from app.analysis import RISK_KEYWORDS
-    
-    # Collect all patterns for the detected risk tags
-    risk_patterns = []
-    for tag in risk_tags:
-        if tag in RISK_KEYWORDS:
-            risk_patterns.extend(RISK_KEYWORDS[tag])
-    
-    if not risk_patterns:
+    wanted = frozenset(tag for tag in risk_tags if tag in RISK_PATTERNS)
+    if not wanted:
         return text[:400]  # fallback if no patterns found
-    
-    # Split text into sentences (simple approach)
-    sentences = re.split(r'[.!?]+', text)
+    combined = _combined_risk_pattern(wanted)
+
     relevant_sentences = []
-    
-    for sentence in sentences:
-        sentence = sentence.strip()
+    total_len = 0
+    for m in _SENT_RE.finditer(text):
+        sentence = m.group().strip()
         if not sentence:
             continue
-        
-        # Check if this sentence contains any risk keywords
+
         sentence_lower = sentence.lower()
-        for pattern in risk_patterns:
-            if pattern.lower() in sentence_lower:
-                relevant_sentences.append(sentence)
+        if RISK_AUTOMATON is not None:
+            hit = next(
+                (True for _end, (tag, _kw) in RISK_AUTOMATON.iter(sentence_lower) if tag in wanted),
+                False,
+            )
+        else:
+            hit = combined.search(sentence_lower) is not None
+        if hit:
+            relevant_sentences.append(sentence)
+            # stop scanning once we have enough to fill the 800-char cap;
+            # +2 accounts for the '. ' joiner
+            total_len += len(sentence) + 2
+            if total_len > 800:
                 break
-    
+
     if relevant_sentences:
         # Join sentences and limit to reasonable length
         result = '. '.join(relevant_sentences)
@@ -93,54 +145,398 @@ except Exception:
     OPENAI_AVAILABLE = False
 
 # Import modularized components
-from app.analysis import analyze_risk, summarize_conversation, extract_themes, uplevel_summary_with_llm
-from app.analysis import uplevel_mental_health_assessment
-from app.storage import save_user_themes, get_user_themes, save_analysis, get_analyses_for_user_date, save_daily_summary, get_daily_summary
-from app.storage import get_user_ids_for_date
+from app.analysis import summarize_conversation, uplevel_summary_with_llm
+from app.analysis import analyze_and_extract, extract_themes_async
+# Matchers built once at analysis-module import; _extract_risk_sentences reuses
+# them (the automaton when pyahocorasick is installed, the compiled per-tag
+# alternations otherwise) rather than re-importing per call
+from app.analysis import RISK_AUTOMATON, RISK_KEYWORDS, RISK_PATTERNS
+from app.analysis import uplevel_mental_health_assessment_async
+from app.analysis import uplevel_mental_health_assessment_batch_async
+from app.storage import get_user_themes, save_analysis_and_themes, get_analyses_for_user_date, save_daily_summary, get_daily_summary
+from app.storage import get_user_ids_for_date, get_aggregates_for_user_date
 from app.storage import get_analyses_for_user
-from sendgrid import SendGridAPIClient
 from app.auth import get_current_user
-from sendgrid.helpers.mail import Mail
-import requests
 import jwt
 from jwt import PyJWKClient
 from app.auth import create_jwt
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
+
+_TRUTHY = frozenset({"1", "true", "yes"})
+
+# Environment configuration read once at import; os.environ.get in request
+# handlers is a dict lookup (plus parsing) repeated on every call.
+STORE_FULL_TEXT = False
+SENDGRID_API_KEY = None
+SENDGRID_FROM = None
+OAUTH_PROVIDER_TOKEN_URL = None
+OAUTH_USERINFO_URL = None
+OAUTH_CLIENT_ID = None
+OAUTH_CLIENT_SECRET = None
+
 
-# Enable permissive CORS for development
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+def refresh_env():
+    """Re-read the module-level configuration from os.environ.
+
+    Called once at import; tests that monkeypatch the environment can call it
+    again to pick up the changes.
+    """
+    global STORE_FULL_TEXT, SENDGRID_API_KEY, SENDGRID_FROM
+    global OAUTH_PROVIDER_TOKEN_URL, OAUTH_USERINFO_URL, OAUTH_CLIENT_ID, OAUTH_CLIENT_SECRET
+    STORE_FULL_TEXT = os.environ.get("STORE_FULL_TEXT", "false").lower() in _TRUTHY
+    SENDGRID_API_KEY = os.environ.get("SENDGRID_API_KEY")
+    SENDGRID_FROM = os.environ.get("SENDGRID_FROM")
+    OAUTH_PROVIDER_TOKEN_URL = os.environ.get('OAUTH_PROVIDER_TOKEN_URL', 'https://oauth2.googleapis.com/token')
+    OAUTH_USERINFO_URL = os.environ.get('OAUTH_USERINFO_URL', 'https://openidconnect.googleapis.com/v1/userinfo')
+    OAUTH_CLIENT_ID = os.environ.get('OAUTH_CLIENT_ID')
+    OAUTH_CLIENT_SECRET = os.environ.get('OAUTH_CLIENT_SECRET')
+
+
+refresh_env()
+
+# One JWKS client for the process: Google's signing keys are stable for hours,
+# so caching the JWK set (1h lifespan) turns the per-login certs fetch into a
+# memory lookup.
+_JWK_CLIENT = PyJWKClient(
+    'https://www.googleapis.com/oauth2/v3/certs', cache_keys=True, lifespan=3600
 )
 
+# High-risk alert email template, parsed once at import (same pattern as
+# _SUMMARY_EMAIL_TMPL): per-alert work is just $-substitution of the ~9
+# dynamic fields instead of re-evaluating a ~2 KB f-string literal.
+_ALERT_EMAIL_TMPL = Template("""
+        <html>
+        <head>
+            <meta charset="utf-8" />
+            <style>
+                body { font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', Arial; color: #111; background: #fff8f6; padding: 24px; }
+                .card { background: #fff; border: 2px solid #fca5a5; border-radius: 12px; padding: 0; max-width: 680px; margin: auto; box-shadow: 0 10px 25px rgba(220,38,38,0.15); overflow: hidden; }
+                .alert-header { background: linear-gradient(135deg, #dc2626, #b91c1c); color: white; padding: 20px; position: relative; }
+                .alert-header::after { content: ''; position: absolute; bottom: 0; left: 0; right: 0; height: 4px; background: linear-gradient(90deg, rgba(255,255,255,0.3), rgba(255,255,255,0.1)); }
+                h1 { font-size: 20px; margin: 0; font-weight: 700; text-shadow: 0 1px 2px rgba(0,0,0,0.1); }
+                .muted { color: #666; font-size: 13px; margin-top: 4px; }
+                .content-wrapper { padding: 20px; }
+                .metrics { display: grid; grid-template-columns: 1fr 1fr; gap: 12px; margin: 0 0 24px 0; }
+                .metric { background: linear-gradient(135deg, #fef2f2, #fff); border: 1px solid #fecaca; padding: 16px; border-radius: 8px; font-size: 13px; box-shadow: 0 2px 4px rgba(0,0,0,0.05); }
+                .metric strong { display: block; color: #374151; font-size: 11px; text-transform: uppercase; letter-spacing: 0.5px; margin-bottom: 4px; }
+                .metric div { font-size: 16px; font-weight: 600; }
+                .risk-badge { display: inline-block; background: linear-gradient(135deg, #dc2626, #b91c1c); color: white; padding: 8px 14px; border-radius: 20px; font-weight: 600; font-size: 12px; margin-right: 8px; margin-bottom: 6px; box-shadow: 0 2px 4px rgba(220,38,38,0.3); }
+                .theme-badge { display: inline-block; background: linear-gradient(135deg, #f8fafc, #f1f5f9); color: #475569; border: 1px solid #e2e8f0; padding: 6px 12px; border-radius: 16px; font-weight: 500; font-size: 11px; margin-right: 6px; margin-bottom: 6px; }
+                .section-header { font-size: 16px; font-weight: 600; margin: 24px 0 12px 0; color: #374151; display: flex; align-items: center; }
+                .section-header.danger { color: #dc2626; }
+                .excerpt { background: linear-gradient(135deg, #f9fafb, #ffffff); border: 1px solid #e5e7eb; border-left: 4px solid #dc2626; padding: 18px; margin: 16px 0; border-radius: 8px; font-size: 14px; line-height: 1.6; box-shadow: 0 2px 4px rgba(0,0,0,0.05); }
+                .summary-section { background: linear-gradient(135deg, #f8fafc, #ffffff); border: 1px solid #e2e8f0; border-radius: 10px; padding: 20px; margin: 24px 0; box-shadow: 0 4px 8px rgba(0,0,0,0.05); }
+                .summary-metrics { display: grid; grid-template-columns: repeat(auto-fit, minmax(140px, 1fr)); gap: 10px; margin-top: 16px; }
+                .summary-metric { background: linear-gradient(135deg, #ffffff, #f9fafb); border: 1px solid #e5e7eb; padding: 14px 12px; border-radius: 8px; text-align: center; box-shadow: 0 1px 3px rgba(0,0,0,0.05); transition: transform 0.2s; }
+                .summary-metric:hover { transform: translateY(-1px); }
+                .summary-metric strong { display: block; color: #6b7280; font-size: 11px; text-transform: uppercase; letter-spacing: 0.5px; margin-bottom: 6px; }
+                .summary-metric div { font-size: 18px; font-weight: 700; }
+                .themes-section { margin-top: 16px; }
+                .themes-title { font-size: 13px; font-weight: 600; color: #6b7280; margin-bottom: 8px; text-transform: uppercase; letter-spacing: 0.5px; }
+                .emergency { background: linear-gradient(135deg, #fee2e2, #fef2f2); border: 2px solid #fecaca; padding: 20px; border-radius: 10px; margin-top: 24px; font-size: 15px; font-weight: 600; text-align: center; box-shadow: 0 4px 8px rgba(220,38,38,0.1); }
+                .emergency::before { content: '⚠️'; font-size: 24px; display: block; margin-bottom: 8px; }
+                .timestamp { color: rgba(255,255,255,0.8); font-size: 12px; font-family: 'SF Mono', Monaco, monospace; margin-top: 8px; font-weight: 400; }
+                @media (max-width: 600px) { 
+                    .metrics { grid-template-columns: 1fr; }
+                    .summary-metrics { grid-template-columns: 1fr; }
+                }
+            </style>
+        </head>
+        <body>
+            <div class="card">
+                <div class="alert-header">
+                    <h1>🚨 High-Risk Content Detected</h1>
+                    <div class="timestamp">Detected: $detected_time</div>
+                </div>
+
+                <div class="content-wrapper">
+                    <div class="metrics">
+    <div class="metric">
+        <strong>Risk Level</strong>
+        <div style="color: #dc2626;">HIGH</div>
+    </div>
+    <div class="metric">
+        <strong>Categories Found</strong>
+        <div>$risk_count</div>
+    </div>
+                    </div>
+
+                    <h2 class="section-header danger">🏷️ Risk Categories Detected</h2>
+                    <div style="margin-bottom: 20px;">
+    $risk_badges_html
+                    </div>
+
+                    <div class="summary-section">
+    <h2 style="font-size: 16px; margin: 0 0 8px 0; color: #374151; font-weight: 600;">📊 Today's Activity Summary</h2>
+    <div class="summary-metrics">
+        <div class="summary-metric">
+            <strong>Total Analyses</strong>
+            <div>$daily_count</div>
+        </div>
+        <div class="summary-metric">
+            <strong>Overall Sentiment</strong>
+            <div style="color: $sentiment_color;">$sentiment_label</div>
+        </div>
+        <div class="summary-metric">
+            <strong>Risk Events</strong>
+            <div style="color: $risk_color;">$daily_risk_total</div>
+        </div>
+    </div>
+    $themes_section
+                    </div>
+
+                    <div class="emergency">
+    If this is an emergency, contact local emergency services immediately
+                    </div>
+                </div>
+            </div>
+        </body>
+        </html>
+    """)
+
+# Summary email template, parsed once at import; per-request work is just
+# $-substitution instead of re-building (and re-copying) the CSS + markup
+_SUMMARY_EMAIL_TMPL = Template("""
+    <html>
+    <head>
+        <meta charset="utf-8" />
+        <style>
+            body { font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', Arial; color: #111; background: #f6f8fb; padding: 24px; }
+            .card { background: #fff; border-radius: 8px; padding: 20px; max-width: 680px; margin: auto; box-shadow: 0 6px 18px rgba(12,20,40,0.08); }
+            h1 { font-size: 18px; margin: 0 0 8px 0; }
+            .muted { color: #556; font-size: 13px; }
+            .metrics { display: flex; gap: 16px; margin: 12px 0 18px 0; flex-wrap: wrap; }
+            .metric { background: #f4f6fb; padding: 10px 12px; border-radius: 6px; font-size: 13px; }
+            table { width: 100%; border-collapse: collapse; margin-top: 8px; }
+            th, td { text-align: left; padding: 8px; border-bottom: 1px solid #eee; font-size: 13px; }
+            .badge { display:inline-block; background:#eef2ff; color:#2b4bd3; padding:4px 8px; border-radius:999px; font-weight:600; font-size:12px; }
+            .assessment { margin-top: 14px; font-size:14px; line-height:1.45; }
+        </style>
+    </head>
+    <body>
+        <div class="card">
+            <h1>Daily summary for $user_id</h1>
+            <div class="muted">Date: $date_label</div>
+
+                    <div class="metrics">
+                        <div class="metric"><strong>Analyses</strong><div>$count</div></div>
+                        <div class="metric"><strong>Avg sentiment</strong><div>$avg_comp_str</div></div>
+                        <div class="metric"><strong>Summary sentiment</strong><div>$sentiment_label</div></div>
+                        <div class="metric"><strong>Risk hits</strong><div>$risk_total</div></div>
+                        <div class="metric"><strong>Top risk</strong><div>$top_risk ($top_risk_count)</div></div>
+                    </div>
+
+            <h2 style="font-size:14px;margin-top:8px;margin-bottom:6px">Top themes</h2>
+            <div>
+                $badges_html
+            </div>
+
+            <h2 style="font-size:14px;margin-top:14px;margin-bottom:6px">Risk highlights</h2>
+            <table>
+                <tr><th>Risk type</th><th>Count</th></tr>
+                $risk_rows
+            </table>
+
+                    <div class="assessment">
+                        $assessment_paragraphs
+                    </div>
+        </div>
+    </body>
+    </html>
+    """)
+
+
+# Shared async HTTP client (SendGrid REST etc.) so handlers reuse pooled
+# connections instead of opening one per request
+_HTTP_CLIENT = None
+
+
+def _http_client() -> httpx.AsyncClient:
+    global _HTTP_CLIENT
+    if _HTTP_CLIENT is None:
+        _HTTP_CLIENT = httpx.AsyncClient(timeout=30)
+    return _HTTP_CLIENT
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    if _HTTP_CLIENT is not None:
+        await _HTTP_CLIENT.aclose()
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=_DefaultResponse)
+
+# Compress large JSON responses (assessment HTML, analyses arrays) when the
+# client sends Accept-Encoding: gzip; small payloads skip compression.
+app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=5)
+
+# Permissive CORS only in dev; production pins the allowed origins and lets
+# browsers cache preflight responses for a day so repeat OPTIONS round-trips
+# (and the per-request wildcard matching) disappear.
+if os.environ.get("ENV", "dev") == "dev":
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=["*"],
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+else:
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=tuple(
+            o for o in os.environ.get("CORS_ALLOW_ORIGINS", "").split(",") if o
+        ),
+        allow_credentials=True,
+        allow_methods=("GET", "POST"),
+        allow_headers=("authorization", "content-type"),
+        max_age=86400,
+    )
+
 
 @app.get("/")
 def read_root():
     return {"Hello": "World"}
 
 
+def _aggregate_rows(rows):
+    """One pass over parsed analysis rows: theme/risk Counters plus the list
+    of compound scores. Shared shape for any in-process aggregation (the
+    per-user endpoints aggregate in SQL instead)."""
+    theme_counts = Counter()
+    risk_counts = Counter()
+    compounds = []
+    for r in rows:
+        theme_counts.update(r.get("themes") or ())
+        risk_counts.update(r.get("risk_tags") or ())
+        sent = r.get("sentiment")
+        c = sent.get("compound") if isinstance(sent, dict) else None
+        if c is not None:
+            try:
+                compounds.append(float(c))
+            except Exception:
+                pass
+    return theme_counts, risk_counts, compounds
+
+
+async def _send_alert_email(used_user_id: str, risk_tags: List[str], analysis_ts: str, all_text: str):
+    """Compose and send the high-risk alert email.
+
+    Runs as a FastAPI background task after the /analyze response has gone
+    out, so the SendGrid round-trip never sits on the request path.
+    """
+    sendgrid_key = SENDGRID_API_KEY
+    send_from = SENDGRID_FROM
+    try:
+        # Get daily summary data for context
+        now = datetime.now(timezone.utc)
+        today_date = now.date().isoformat()
+        try:
+            daily_analyses = get_analyses_for_user_date(used_user_id, today_date)
+            theme_counts, risk_counts, compounds = _aggregate_rows(daily_analyses)
+
+            daily_summary = {
+                "themes": theme_counts,
+                "risk_counts": risk_counts,
+                "avg_sentiment": {"compound": (sum(compounds) / len(compounds) if compounds else None)},
+                "count": len(daily_analyses),
+            }
+        except Exception as e:
+            logger.debug("error getting daily summary: %s", e)
+            daily_summary = {"themes": Counter(), "risk_counts": Counter(), "avg_sentiment": {"compound": None}, "count": 0}
+        
+        # Calculate daily summary metrics for use in email
+        daily_risk_total = sum(daily_summary.get("risk_counts", {}).values())
+        daily_avg_sentiment = daily_summary.get("avg_sentiment", {}).get("compound")
+        
+        # Override sentiment label if high-risk content detected
+        daily_sentiment_label = "neutral"
+        if daily_summary.get("risk_counts", {}).get("self_harm", 0) > 0:
+            daily_sentiment_label = "negative"  # Force negative for self-harm content
+        elif daily_avg_sentiment is not None:
+            if daily_avg_sentiment >= 0.05:
+                daily_sentiment_label = "positive"
+            elif daily_avg_sentiment <= -0.05:
+                daily_sentiment_label = "negative"
+        
+        # Compose a short alert email (plain + html) with only sentences containing risk keywords
+        excerpt = _extract_risk_sentences(all_text or '', risk_tags)
+        detected_time = analysis_ts or now.isoformat()
+        subj = f"🚨 SafeChat AI Alert: High-Risk Content Detected - {used_user_id}"
+        plain = (
+            f"🚨 HIGH-RISK CONTENT DETECTED 🚨\n\n"
+            f"We detected high-risk content in recent analyzed messages.\n\n"
+            f"ALERT DETAILS:\n"
+            f"Risk tags: {', '.join(risk_tags)}\n"
+            f"Detected at: {detected_time}\n\n"
+            f"TODAY'S ACTIVITY SUMMARY:\n"
+            f"- Total analyses: {daily_summary.get('count', 0)}\n"
+            f"- Overall sentiment: {daily_sentiment_label.title()}\n"
+            f"- Total risk events: {daily_risk_total}\n"
+            f"- Top themes: {', '.join(f'{t}({c})' for t, c in daily_summary['themes'].most_common(3))}\n\n"
+            "⚠️ If this is an emergency, contact local emergency services immediately."
+        )
+        
+        # Create styled HTML similar to summary email but with urgent styling
+        risk_badges_html = ''.join([f'<span class="risk-badge">{tag}</span>' for tag in risk_tags])
+        
+        # Format daily summary data
+        daily_themes_html = ''.join(
+            f'<span class="theme-badge">{theme} ({count})</span>'
+            for theme, count in daily_summary["themes"].most_common(5)
+        )
+        
+        html = _ALERT_EMAIL_TMPL.substitute(
+            detected_time=detected_time,
+            risk_count=len(risk_tags),
+            risk_badges_html=risk_badges_html,
+            daily_count=daily_summary.get('count', 0),
+            sentiment_color=('#059669' if daily_sentiment_label == 'positive' else '#dc2626' if daily_sentiment_label == 'negative' else '#6b7280'),
+            sentiment_label=daily_sentiment_label.title(),
+            risk_color=('#dc2626' if daily_risk_total > 0 else '#059669'),
+            daily_risk_total=daily_risk_total,
+            themes_section=(f'<div class="themes-section"><div class="themes-title">Top Themes Today</div><div>{daily_themes_html}</div></div>' if daily_themes_html else ''),
+        )
+
+        alert_payload = {
+            "personalizations": [{"to": [{"email": used_user_id}], "subject": subj}],
+            "from": {"email": send_from},
+            "content": [
+                {"type": "text/plain", "value": plain},
+                {"type": "text/html", "value": html},
+            ],
+        }
+        sg_resp = await _http_client().post(
+            "https://api.sendgrid.com/v3/mail/send",
+            **_sendgrid_request_kwargs(alert_payload, sendgrid_key),
+        )
+        if sg_resp.status_code >= 400:
+            logger.warning("alert email send failed: %s %s", sg_resp.status_code, sg_resp.text)
+    except Exception as e:
+        logger.warning("error sending alert email: %s", e)
+
+
 @app.post("/analyze")
-def analyze(messages: List[Dict[str, Any]] = Body(...), current_user: Dict[str, Any] = Depends(get_current_user)):
+async def analyze(background_tasks: BackgroundTasks, messages: List[Dict[str, Any]] = Body(...), current_user: Dict[str, Any] = Depends(get_current_user)):
     """
     Expected payload: a JSON array of messages like:
     [{"sender": "child", "text": "I want to..."}, ...]
 
     Response: {classification fields...}
     """
-    # Combine all text for sentiment, but keep per-message tags too
-    all_text = " \n ".join(m.get("text", "") for m in messages)
-
-    # Extract themes first so we can use them for risk analysis
-    themes = extract_themes(all_text)
-    result = analyze_risk(all_text, themes)
+    # One combined pass: joins the texts once and shares the string between
+    # theme extraction and the risk/sentiment scan
+    result = await analyze_and_extract(messages)
+    all_text = result["text"]
+    themes = result["themes"]
 
     response = {
         "danger_level": result["danger_level"],
-        "risk_tags": list(set(result["risk_tags"])),
+        # analyze_risk returns a sorted, de-duplicated list, so the JSON
+        # output is deterministic with no extra set/list round trip here
+        "risk_tags": result["risk_tags"],
         "keyword_tags": result.get("keyword_tags", []),
         "theme_tags": result.get("theme_tags", []),
         "sentiment": result["sentiment"],
@@ -154,240 +550,49 @@ def analyze(messages: List[Dict[str, Any]] = Body(...), current_user: Dict[str,
         # Strict enforcement: reject unauthenticated requests
         raise HTTPException(status_code=401, detail='Authentication required')
 
-    # Persist themes if user_id provided (use the resolved used_user_id)
-    if used_user_id:
-        try:
-            save_user_themes(used_user_id, response["themes"])
-            response["themes_saved"] = True
-        except Exception as e:
-            response["themes_saved"] = False
-            response["themes_save_error"] = str(e)
-
-    # Persist a per-request analysis row for later aggregation: ts, user_id, compound sentiment, themes
+    # Persist the analysis row and the themes row in one transaction
     if used_user_id:
         try:
-            ts = datetime.utcnow().replace(tzinfo=timezone.utc).isoformat()
-            # save_analysis expects message_text and a full analysis dict; include sentiment/risk/danger
+            ts = datetime.now(timezone.utc).isoformat()
             analysis_payload = {
                 "sentiment": result.get("sentiment"),
                 "risk_tags": result.get("risk_tags"),
                 "danger_level": result.get("danger_level"),
             }
-            # Control whether to store full text via env var to respect privacy
-            STORE_FULL_TEXT = os.environ.get("STORE_FULL_TEXT", "false").lower() in ("1", "true", "yes")
+            # Whether to store full text is env-controlled to respect privacy
             message_text_to_store = all_text if STORE_FULL_TEXT else None
-            save_analysis(used_user_id, message_text_to_store, analysis_payload, ts=ts, themes=response.get("themes"))
-            response["analysis_saved"] = True
+            save_analysis_and_themes(used_user_id, message_text_to_store, analysis_payload, ts=ts, themes=response.get("themes"))
+            response["persisted"] = True
             response["analysis_ts"] = ts
             response["stored_text"] = bool(message_text_to_store)
         except Exception as e:
-            response["analysis_saved"] = False
-            response["analysis_save_error"] = str(e)
+            response["persisted"] = False
+            response["persist_error"] = str(e)
 
     # include which user id was used to persist
     response["used_user_id"] = used_user_id
 
-    # If this analysis detects high danger, attempt to notify the user's email address (POC behavior)
-    try:
-        print("risk detected:", result.get('danger_level'))
-        if str(result.get('danger_level')).lower() == 'high':
-            print("sending email to:", used_user_id)
-            # basic email address heuristic
-            if isinstance(used_user_id, str) and '@' in used_user_id and '.' in used_user_id.split('@')[-1]:
-                sendgrid_key = os.environ.get('SENDGRID_API_KEY')
-                send_from = os.environ.get('SENDGRID_FROM')
-                if sendgrid_key and send_from:
-                    try:
-                        # Get daily summary data for context
-                        today_date = datetime.utcnow().date().isoformat()
-                        try:
-                            daily_analyses = get_analyses_for_user_date(used_user_id, today_date)
-                            
-                            # Build summary metrics
-                            theme_counts = {}
-                            compounds = []
-                            risk_counts = {}
-                            for r in daily_analyses:
-                                for t in r.get("themes", []):
-                                    theme_counts[t] = theme_counts.get(t, 0) + 1
-                                for rt in r.get("risk_tags", []):
-                                    risk_counts[rt] = risk_counts.get(rt, 0) + 1
-                                sent = r.get("sentiment") or {}
-                                c = sent.get("compound") if isinstance(sent, dict) else None
-                                if c is not None:
-                                    try:
-                                        compounds.append(float(c))
-                                    except Exception:
-                                        pass
-                            
-                            daily_summary = {
-                                "themes": theme_counts,
-                                "risk_counts": risk_counts,
-                                "avg_sentiment": {"compound": (sum(compounds) / len(compounds) if compounds else None)},
-                                "count": len(daily_analyses),
-                            }
-                        except Exception as e:
-                            print(f"DEBUG: Error getting daily summary: {e}")
-                            daily_summary = {"themes": {}, "risk_counts": {}, "avg_sentiment": {"compound": None}, "count": 0}
-                        
-                        # Calculate daily summary metrics for use in email
-                        daily_risk_total = sum(daily_summary.get("risk_counts", {}).values())
-                        daily_avg_sentiment = daily_summary.get("avg_sentiment", {}).get("compound")
-                        
-                        # Override sentiment label if high-risk content detected
-                        daily_sentiment_label = "neutral"
-                        if daily_summary.get("risk_counts", {}).get("self_harm", 0) > 0:
-                            daily_sentiment_label = "negative"  # Force negative for self-harm content
-                        elif daily_avg_sentiment is not None:
-                            if daily_avg_sentiment >= 0.05:
-                                daily_sentiment_label = "positive"
-                            elif daily_avg_sentiment <= -0.05:
-                                daily_sentiment_label = "negative"
-                        
-                        # Compose a short alert email (plain + html) with only sentences containing risk keywords
-                        excerpt = _extract_risk_sentences(all_text or '', response.get('risk_tags', []))
-                        detected_time = response.get('analysis_ts', datetime.utcnow().isoformat())
-                        subj = f"🚨 SafeChat AI Alert: High-Risk Content Detected - {used_user_id}"
-                        plain = (
-                            f"🚨 HIGH-RISK CONTENT DETECTED 🚨\n\n"
-                            f"We detected high-risk content in recent analyzed messages.\n\n"
-                            f"ALERT DETAILS:\n"
-                            f"Risk tags: {', '.join(response.get('risk_tags', []))}\n"
-                            f"Detected at: {detected_time}\n\n"
-                            f"TODAY'S ACTIVITY SUMMARY:\n"
-                            f"- Total analyses: {daily_summary.get('count', 0)}\n"
-                            f"- Overall sentiment: {daily_sentiment_label.title()}\n"
-                            f"- Total risk events: {daily_risk_total}\n"
-                            f"- Top themes: {', '.join([f'{t}({c})' for t, c in sorted(daily_summary.get('themes', {}).items(), key=lambda x: x[1], reverse=True)[:3]])}\n\n"
-                            "⚠️ If this is an emergency, contact local emergency services immediately."
-                        )
-                        
-                        # Create styled HTML similar to summary email but with urgent styling
-                        risk_badges_html = ''.join([f'<span class="risk-badge">{tag}</span>' for tag in response.get('risk_tags', [])])
-                        
-                        # Format daily summary data
-                        daily_themes_html = ''
-                        if daily_summary.get("themes"):
-                            top_themes = sorted(daily_summary["themes"].items(), key=lambda x: x[1], reverse=True)[:5]
-                            daily_themes_html = ''.join([f'<span class="theme-badge">{theme} ({count})</span>' for theme, count in top_themes])
-                        
-                        html = f"""
-                        <html>
-                        <head>
-                            <meta charset="utf-8" />
-                            <style>
-                                body {{ font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', Arial; color: #111; background: #fff8f6; padding: 24px; }}
-                                .card {{ background: #fff; border: 2px solid #fca5a5; border-radius: 12px; padding: 0; max-width: 680px; margin: auto; box-shadow: 0 10px 25px rgba(220,38,38,0.15); overflow: hidden; }}
-                                .alert-header {{ background: linear-gradient(135deg, #dc2626, #b91c1c); color: white; padding: 20px; position: relative; }}
-                                .alert-header::after {{ content: ''; position: absolute; bottom: 0; left: 0; right: 0; height: 4px; background: linear-gradient(90deg, rgba(255,255,255,0.3), rgba(255,255,255,0.1)); }}
-                                h1 {{ font-size: 20px; margin: 0; font-weight: 700; text-shadow: 0 1px 2px rgba(0,0,0,0.1); }}
-                                .muted {{ color: #666; font-size: 13px; margin-top: 4px; }}
-                                .content-wrapper {{ padding: 20px; }}
-                                .metrics {{ display: grid; grid-template-columns: 1fr 1fr; gap: 12px; margin: 0 0 24px 0; }}
-                                .metric {{ background: linear-gradient(135deg, #fef2f2, #fff); border: 1px solid #fecaca; padding: 16px; border-radius: 8px; font-size: 13px; box-shadow: 0 2px 4px rgba(0,0,0,0.05); }}
-                                .metric strong {{ display: block; color: #374151; font-size: 11px; text-transform: uppercase; letter-spacing: 0.5px; margin-bottom: 4px; }}
-                                .metric div {{ font-size: 16px; font-weight: 600; }}
-                                .risk-badge {{ display: inline-block; background: linear-gradient(135deg, #dc2626, #b91c1c); color: white; padding: 8px 14px; border-radius: 20px; font-weight: 600; font-size: 12px; margin-right: 8px; margin-bottom: 6px; box-shadow: 0 2px 4px rgba(220,38,38,0.3); }}
-                                .theme-badge {{ display: inline-block; background: linear-gradient(135deg, #f8fafc, #f1f5f9); color: #475569; border: 1px solid #e2e8f0; padding: 6px 12px; border-radius: 16px; font-weight: 500; font-size: 11px; margin-right: 6px; margin-bottom: 6px; }}
-                                .section-header {{ font-size: 16px; font-weight: 600; margin: 24px 0 12px 0; color: #374151; display: flex; align-items: center; }}
-                                .section-header.danger {{ color: #dc2626; }}
-                                .excerpt {{ background: linear-gradient(135deg, #f9fafb, #ffffff); border: 1px solid #e5e7eb; border-left: 4px solid #dc2626; padding: 18px; margin: 16px 0; border-radius: 8px; font-size: 14px; line-height: 1.6; box-shadow: 0 2px 4px rgba(0,0,0,0.05); }}
-                                .summary-section {{ background: linear-gradient(135deg, #f8fafc, #ffffff); border: 1px solid #e2e8f0; border-radius: 10px; padding: 20px; margin: 24px 0; box-shadow: 0 4px 8px rgba(0,0,0,0.05); }}
-                                .summary-metrics {{ display: grid; grid-template-columns: repeat(auto-fit, minmax(140px, 1fr)); gap: 10px; margin-top: 16px; }}
-                                .summary-metric {{ background: linear-gradient(135deg, #ffffff, #f9fafb); border: 1px solid #e5e7eb; padding: 14px 12px; border-radius: 8px; text-align: center; box-shadow: 0 1px 3px rgba(0,0,0,0.05); transition: transform 0.2s; }}
-                                .summary-metric:hover {{ transform: translateY(-1px); }}
-                                .summary-metric strong {{ display: block; color: #6b7280; font-size: 11px; text-transform: uppercase; letter-spacing: 0.5px; margin-bottom: 6px; }}
-                                .summary-metric div {{ font-size: 18px; font-weight: 700; }}
-                                .themes-section {{ margin-top: 16px; }}
-                                .themes-title {{ font-size: 13px; font-weight: 600; color: #6b7280; margin-bottom: 8px; text-transform: uppercase; letter-spacing: 0.5px; }}
-                                .emergency {{ background: linear-gradient(135deg, #fee2e2, #fef2f2); border: 2px solid #fecaca; padding: 20px; border-radius: 10px; margin-top: 24px; font-size: 15px; font-weight: 600; text-align: center; box-shadow: 0 4px 8px rgba(220,38,38,0.1); }}
-                                .emergency::before {{ content: '⚠️'; font-size: 24px; display: block; margin-bottom: 8px; }}
-                                .timestamp {{ color: rgba(255,255,255,0.8); font-size: 12px; font-family: 'SF Mono', Monaco, monospace; margin-top: 8px; font-weight: 400; }}
-                                @media (max-width: 600px) {{ 
-                                    .metrics {{ grid-template-columns: 1fr; }}
-                                    .summary-metrics {{ grid-template-columns: 1fr; }}
-                                }}
-                            </style>
-                        </head>
-                        <body>
-                            <div class="card">
-                                <div class="alert-header">
-                                    <h1>🚨 High-Risk Content Detected</h1>
-                                    <div class="timestamp">Detected: {detected_time}</div>
-                                </div>
-
-                                <div class="content-wrapper">
-                                    <div class="metrics">
-                                        <div class="metric">
-                                            <strong>Risk Level</strong>
-                                            <div style="color: #dc2626;">HIGH</div>
-                                        </div>
-                                        <div class="metric">
-                                            <strong>Categories Found</strong>
-                                            <div>{len(response.get('risk_tags', []))}</div>
-                                        </div>
-                                    </div>
-
-                                    <h2 class="section-header danger">🏷️ Risk Categories Detected</h2>
-                                    <div style="margin-bottom: 20px;">
-                                        {risk_badges_html}
-                                    </div>
-
-                                    <div class="summary-section">
-                                        <h2 style="font-size: 16px; margin: 0 0 8px 0; color: #374151; font-weight: 600;">📊 Today's Activity Summary</h2>
-                                        <div class="summary-metrics">
-                                            <div class="summary-metric">
-                                                <strong>Total Analyses</strong>
-                                                <div>{daily_summary.get('count', 0)}</div>
-                                            </div>
-                                            <div class="summary-metric">
-                                                <strong>Overall Sentiment</strong>
-                                                <div style="color: {'#059669' if daily_sentiment_label == 'positive' else '#dc2626' if daily_sentiment_label == 'negative' else '#6b7280'};">{daily_sentiment_label.title()}</div>
-                                            </div>
-                                            <div class="summary-metric">
-                                                <strong>Risk Events</strong>
-                                                <div style="color: {'#dc2626' if daily_risk_total > 0 else '#059669'};">{daily_risk_total}</div>
-                                            </div>
-                                        </div>
-                                        {f'<div class="themes-section"><div class="themes-title">Top Themes Today</div><div>{daily_themes_html}</div></div>' if daily_themes_html else ''}
-                                    </div>
-
-                                    <div class="emergency">
-                                        If this is an emergency, contact local emergency services immediately
-                                    </div>
-                                </div>
-                            </div>
-                        </body>
-                        </html>
-                        """
-
-                        msg = Mail(
-                            from_email=send_from,
-                            to_emails=used_user_id,
-                            subject=subj,
-                            plain_text_content=plain,
-                            html_content=html,
-                        )
-                        sg = SendGridAPIClient(sendgrid_key)
-                        sg_resp = sg.send(msg)
-                        response['alert_email_sent'] = True
-                        response['alert_email_status'] = getattr(sg_resp, 'status_code', None)
-                    except Exception as e:
-                        print(f"DEBUG: Error sending alert email: {e}")
-                        response['alert_email_sent'] = False
-                        response['alert_email_error'] = str(e)
-                else:
-                    print(f"DEBUG: Missing SENDGRID_API_KEY or SENDGRID_FROM")
-                    response['alert_email_sent'] = False
-                    response['alert_email_error'] = 'Missing SENDGRID_API_KEY or SENDGRID_FROM'
-            else:
-                print(f"DEBUG: used_user_id is not a valid email: {used_user_id}")
-                response['alert_email_sent'] = False
-                response['alert_email_error'] = 'used_user_id is not an email'
-    except Exception as e:
-        # Don't let email failures break analyze
-        response['alert_email_sent'] = False
-        response['alert_email_error'] = str(e)
+    # If this analysis detects high danger, queue an alert email; the
+    # SendGrid round-trip runs as a background task after the response is sent
+    is_high_risk = (result.get('danger_level') or '').lower() == 'high'
+    if is_high_risk:
+        logger.debug("high risk detected; alerting %s", used_user_id)
+        # basic email address heuristic
+        if not (isinstance(used_user_id, str) and '@' in used_user_id and '.' in used_user_id.split('@')[-1]):
+            response['alert_email_queued'] = False
+            response['alert_email_error'] = 'used_user_id is not an email'
+        elif not (SENDGRID_API_KEY and SENDGRID_FROM):
+            response['alert_email_queued'] = False
+            response['alert_email_error'] = 'Missing SENDGRID_API_KEY or SENDGRID_FROM'
+        else:
+            background_tasks.add_task(
+                _send_alert_email,
+                used_user_id,
+                response.get('risk_tags', []),
+                response.get('analysis_ts'),
+                all_text,
+            )
+            response['alert_email_queued'] = True
 
     return response
 
@@ -432,10 +637,10 @@ async def auth_exchange(request: Request):
         print(f"DEBUG: Error parsing request: {e}")
         raise HTTPException(status_code=400, detail=f'Invalid request body: {e}')
     
-    token_url = os.environ.get('OAUTH_PROVIDER_TOKEN_URL', 'https://oauth2.googleapis.com/token')
-    userinfo_url = os.environ.get('OAUTH_USERINFO_URL', 'https://openidconnect.googleapis.com/v1/userinfo')
-    client_id = os.environ.get('OAUTH_CLIENT_ID')
-    client_secret = os.environ.get('OAUTH_CLIENT_SECRET')
+    token_url = OAUTH_PROVIDER_TOKEN_URL
+    userinfo_url = OAUTH_USERINFO_URL
+    client_id = OAUTH_CLIENT_ID
+    client_secret = OAUTH_CLIENT_SECRET
     
     print(f"DEBUG: client_id exists: {bool(client_id)}, client_secret exists: {bool(client_secret)}")
 
@@ -443,9 +648,11 @@ async def auth_exchange(request: Request):
         print("ERROR: Missing OAUTH_CLIENT_ID or OAUTH_CLIENT_SECRET")
         raise HTTPException(status_code=400, detail='OAUTH_CLIENT_ID and OAUTH_CLIENT_SECRET must be set on the server')
 
-    # Exchange code for provider tokens
+    # Exchange code for provider tokens on the shared async client; a
+    # blocking requests call here would pin the event loop for the whole
+    # provider round trip
     try:
-        resp = requests.post(token_url, data={
+        resp = await _http_client().post(token_url, data={
             'grant_type': 'authorization_code',
             'code': code,
             'redirect_uri': redirect_uri,
@@ -453,10 +660,10 @@ async def auth_exchange(request: Request):
             'client_secret': client_secret,
             'code_verifier': code_verifier,
         }, headers={'Accept': 'application/json'}, timeout=15)
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=502, detail=f'Provider token request failed: {e}')
 
-    if not resp.ok:
+    if resp.status_code >= 400:
         raise HTTPException(status_code=502, detail=f'Provider token exchange failed: {resp.status_code} {resp.text}')
 
     token_data = resp.json()
@@ -469,9 +676,7 @@ async def auth_exchange(request: Request):
     # Try verify id_token using provider JWKS (Google)
     if id_token:
         try:
-            jwks_uri = 'https://www.googleapis.com/oauth2/v3/certs'
-            jwk_client = PyJWKClient(jwks_uri)
-            signing_key = jwk_client.get_signing_key_from_jwt(id_token)
+            signing_key = _JWK_CLIENT.get_signing_key_from_jwt(id_token)
             payload = jwt.decode(id_token, signing_key.key, algorithms=[signing_key.algorithm], audience=client_id)
             subject = payload.get('sub')
             user_email = payload.get('email')
@@ -482,8 +687,8 @@ async def auth_exchange(request: Request):
     # If we don't have subject/email yet, call userinfo with access_token
     if (not subject or not user_email) and access_token:
         try:
-            ui = requests.get(userinfo_url, headers={'Authorization': f'Bearer {access_token}'}, timeout=8)
-            if ui.ok:
+            ui = await _http_client().get(userinfo_url, headers={'Authorization': f'Bearer {access_token}'}, timeout=8)
+            if ui.status_code < 400:
                 profile = ui.json()
                 subject = subject or profile.get('sub')
                 user_email = user_email or profile.get('email')
@@ -513,100 +718,110 @@ def analyses_for_user(user_id: str, date: str = Query(None, description="YYYY-MM
     return {"user_id": user_id, "count": len(rows), "analyses": rows}
 
 
-@app.get("/mental_health/{user_id}")
-def mental_health_assessment(user_id: str, date: str = Query(None, description="YYYY-MM-DD optional date filter")):
-    """Return a human-readable mental health assessment and recommended next steps using an LLM.
+def _aggregate_user(user_id: str, date: str = None):
+    """Aggregate a user's analyses into LLM-ready metrics.
 
-    It will aggregate themes and sentiment for the date (or all time if omitted), then call the LLM helper.
+    Returns (aggregated, top_themes) where aggregated carries theme/risk
+    counts and average sentiment only (no raw text). The counting happens in
+    SQL (get_aggregates_for_user_date), so only the aggregate rows cross the
+    driver instead of the user's full history.
     """
     try:
-        if date:
-            rows = get_analyses_for_user_date(user_id, date)
-        else:
-            rows = get_analyses_for_user(user_id)
+        agg = get_aggregates_for_user_date(user_id, date)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-    # Build aggregated metrics for the LLM using themes and risk counts only (no raw text)
-    theme_counts = {}
-    compounds = []
-    risk_counts = {}
-    for r in rows:
-        for t in r.get("themes", []):
-            theme_counts[t] = theme_counts.get(t, 0) + 1
-        for rt in r.get("risk_tags", []):
-            risk_counts[rt] = risk_counts.get(rt, 0) + 1
-        sent = r.get("sentiment") or {}
-        c = sent.get("compound") if isinstance(sent, dict) else None
-        if c is not None:
-            try:
-                compounds.append(float(c))
-            except Exception:
-                pass
-
+    top_theme_counts = Counter(agg["themes"]).most_common(8)
     aggregated = {
-        "themes": theme_counts,
-        "risk_counts": risk_counts,
-        "avg_sentiment": {"compound": (sum(compounds) / len(compounds) if compounds else None)},
-        "count": len(rows),
+        "themes": agg["themes"],
+        # Pre-sorted top-8 (name, count) pairs so email rendering reuses this
+        # instead of re-sorting the full theme dict
+        "top_themes": top_theme_counts,
+        "risk_counts": agg["risk_counts"],
+        "avg_sentiment": {"compound": agg["avg_compound"]},
+        "count": agg["count"],
     }
 
     # Provide top themes as non-identifying context to the LLM
-    top_themes = [t for t, _ in sorted(theme_counts.items(), key=lambda x: x[1], reverse=True)[:8]]
+    top_themes = [t for t, _ in top_theme_counts]
+    return aggregated, top_themes
+
+
+# Short-lived cache of finished assessment payloads so a preview followed by
+# a send (or repeated refreshes) within the TTL reuses the LLM result. Keyed
+# on a digest of the aggregated metrics, so new analyses invalidate naturally.
+_MH_CACHE: Dict[tuple, tuple] = {}
+_MH_CACHE_TTL = 300
+_MH_CACHE_MAX = 1024
+
+
+async def _build_mental_health(user_id: str, date: str = None, use_cache: bool = True) -> dict:
+    """Aggregate a user's analyses and produce the LLM assessment payload.
+
+    Plain helper shared by the /mental_health route and the email paths so
+    internal callers skip the route wrapper entirely. Pass use_cache=False to
+    bypass the short-lived payload cache and force a fresh LLM call.
+
+    The returned payload carries everything downstream consumers need
+    (aggregated counts incl. the pre-sorted top_themes, plus the rendered
+    assessment), so email composition must read from it rather than hitting
+    the database again.
+    """
+    aggregated, top_themes = _aggregate_user(user_id, date)
+
+    agg_hash = hashlib.blake2b(repr(sorted(aggregated.items())).encode(), digest_size=16).hexdigest()
+    cache_key = (user_id, date, agg_hash)
+    if use_cache:
+        hit = _MH_CACHE.get(cache_key)
+        if hit is not None and hit[0] > time.monotonic():
+            return hit[1]
 
     try:
-        assessment_text = uplevel_mental_health_assessment(aggregated, top_themes, user_id=user_id)
+        assessment_text = await uplevel_mental_health_assessment_async(aggregated, top_themes, user_id=user_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"LLM error: {e}")
 
-    # Convert any markdown bold in the assessment into HTML so clients receive rendered tags
-    assessment_html = _md_bold_to_html(assessment_text)
-    assessment_plain = _md_bold_to_plain(assessment_text)
+    # Render markdown bold + paragraphs into HTML (and a plaintext fallback) in one pass
+    assessment_html, assessment_plain = _render_assessment(assessment_text)
 
     # Return a non-null date string for clients; if no date filter was provided, use today's date
-    resolved_date = date or datetime.utcnow().date().isoformat()
-    return {"user_id": user_id, "date": resolved_date, "aggregated": aggregated, "assessment": assessment_html, "assessment_plain": assessment_plain}
+    resolved_date = date or datetime.now(timezone.utc).date().isoformat()
+    payload = {"user_id": user_id, "date": resolved_date, "aggregated": aggregated, "assessment": assessment_html, "assessment_plain": assessment_plain}
 
+    if len(_MH_CACHE) >= _MH_CACHE_MAX:
+        _MH_CACHE.pop(next(iter(_MH_CACHE)))
+    _MH_CACHE[cache_key] = (time.monotonic() + _MH_CACHE_TTL, payload)
+    return payload
 
-@app.post("/email_summary/{user_id}")
-def email_summary(user_id: str, date: str = Body(None, embed=True)):
-    """Compose the mental health assessment and email it using SendGrid.
 
-    Requires SENDGRID_API_KEY and SENDGRID_FROM environment variables. 
-    The user_id is used as the email recipient.
+@app.get("/mental_health/{user_id}")
+async def mental_health_assessment(user_id: str, date: str = Query(None, description="YYYY-MM-DD optional date filter")):
+    """Return a human-readable mental health assessment and recommended next steps using an LLM.
+
+    It will aggregate themes and sentiment for the date (or all time if omitted), then call the LLM helper.
     """
-    # build the assessment
-    try:
-        mh = mental_health_assessment(user_id, date=date)
-    except HTTPException as e:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return await _build_mental_health(user_id, date=date)
 
-    sendgrid_key = os.environ.get("SENDGRID_API_KEY")
-    send_from = os.environ.get("SENDGRID_FROM")
-    send_to = user_id  # Use user_id directly as email recipient
 
-    if not sendgrid_key or not send_from or not send_to:
-            raise HTTPException(status_code=400, detail="SENDGRID_API_KEY and SENDGRID_FROM must be set")
+def _compose_summary_email(user_id: str, date: str, mh: dict, send_from: str) -> dict:
+    """Build the SendGrid mail payload for a finished assessment.
 
+    Shared by the single-user and batch email endpoints; the user_id doubles
+    as the recipient address.
+    """
     subject = f"Daily summary for {user_id}"
     agg = mh["aggregated"]
-    # Build an HTML email with simple styling
-    top_themes = agg.get("themes") if isinstance(agg.get("themes"), dict) else {}
+    # Build an HTML email with simple styling; top_themes arrives pre-sorted
+    # from _aggregate_user so no re-sort is needed here
+    top_themes = agg.get("top_themes") or []
     risk_counts = agg.get("risk_counts", {})
     avg_comp = agg.get("avg_sentiment", {}).get("compound")
 
-    # Precompute badge HTML and risk rows to avoid evaluation errors in the f-string
-    try:
-            badges_html = ''.join(['<span class="badge">{} ({})</span> '.format(t, c) for t, c in sorted(top_themes.items(), key=lambda x: x[1], reverse=True)[:8]])
-    except Exception:
-            badges_html = ''
-
-    try:
-            risk_rows = ''.join(["<tr><td>{}</td><td>{}</td></tr>".format(k, v) for k, v in risk_counts.items()])
-    except Exception:
-            risk_rows = ''
+    # Escape everything that originated outside the server (user id, theme
+    # names, risk keys) before it lands in markup
+    safe_uid = escape(user_id)
+    badges_html = ''.join(f'<span class="badge">{escape(str(t))} ({c})</span> ' for t, c in top_themes)
+    risk_rows = ''.join(f"<tr><td>{escape(str(k))}</td><td>{v}</td></tr>" for k, v in risk_counts.items())
 
     avg_comp_str = f"{avg_comp:.3f}" if isinstance(avg_comp, (int, float)) else 'N/A'
 
@@ -621,88 +836,57 @@ def email_summary(user_id: str, date: str = Body(None, embed=True)):
     else:
         sentiment_label = 'N/A'
 
-    # risk summary: total hits and top risk
-    try:
-        risk_total = sum(int(v) for v in risk_counts.values())
-    except Exception:
-        risk_total = 0
-    if risk_counts:
+    # risk summary: total hits, top risk and the plaintext breakdown in one
+    # pass instead of a sum, a max and a join each walking the dict
+    risk_total = 0
+    top_risk, top_risk_count = None, 0
+    risk_parts = []
+    for k, v in risk_counts.items():
         try:
-            top_risk, top_risk_count = max(risk_counts.items(), key=lambda x: int(x[1]))
+            iv = int(v)
         except Exception:
-            top_risk, top_risk_count = None, 0
-    else:
-        top_risk, top_risk_count = None, 0
-
-    # Prepare HTML and plaintext assessment using newline-aware helpers
-    assessment_html_raw = mh.get('assessment') or ''
-    assessment_plain_raw = mh.get('assessment_plain') or ''
-    # Ensure bold markers in the html raw are preserved as <strong>, then convert newlines
-    assessment_html = _nl_to_html_paragraphs(assessment_html_raw)
-    assessment_plain = _nl_to_plain(assessment_plain_raw)
-    assessment_paragraphs = assessment_html
-
-    html = f"""
-    <html>
-    <head>
-        <meta charset="utf-8" />
-        <style>
-            body {{ font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', Roboto, 'Helvetica Neue', Arial; color: #111; background: #f6f8fb; padding: 24px; }}
-            .card {{ background: #fff; border-radius: 8px; padding: 20px; max-width: 680px; margin: auto; box-shadow: 0 6px 18px rgba(12,20,40,0.08); }}
-            h1 {{ font-size: 18px; margin: 0 0 8px 0; }}
-            .muted {{ color: #556; font-size: 13px; }}
-            .metrics {{ display: flex; gap: 16px; margin: 12px 0 18px 0; flex-wrap: wrap; }}
-            .metric {{ background: #f4f6fb; padding: 10px 12px; border-radius: 6px; font-size: 13px; }}
-            table {{ width: 100%; border-collapse: collapse; margin-top: 8px; }}
-            th, td {{ text-align: left; padding: 8px; border-bottom: 1px solid #eee; font-size: 13px; }}
-            .badge {{ display:inline-block; background:#eef2ff; color:#2b4bd3; padding:4px 8px; border-radius:999px; font-weight:600; font-size:12px; }}
-            .assessment {{ margin-top: 14px; font-size:14px; line-height:1.45; }}
-        </style>
-    </head>
-    <body>
-        <div class="card">
-            <h1>Daily summary for {user_id}</h1>
-            <div class="muted">Date: {date or 'All time'}</div>
-
-                    <div class="metrics">
-                        <div class="metric"><strong>Analyses</strong><div>{agg.get('count')}</div></div>
-                        <div class="metric"><strong>Avg sentiment</strong><div>{avg_comp_str}</div></div>
-                        <div class="metric"><strong>Summary sentiment</strong><div>{sentiment_label}</div></div>
-                        <div class="metric"><strong>Risk hits</strong><div>{risk_total}</div></div>
-                        <div class="metric"><strong>Top risk</strong><div>{top_risk or 'None'} ({top_risk_count})</div></div>
-                    </div>
-
-            <h2 style="font-size:14px;margin-top:8px;margin-bottom:6px">Top themes</h2>
-            <div>
-                {badges_html}
-            </div>
-
-            <h2 style="font-size:14px;margin-top:14px;margin-bottom:6px">Risk highlights</h2>
-            <table>
-                <tr><th>Risk type</th><th>Count</th></tr>
-                {risk_rows}
-            </table>
-
-                    <div class="assessment">
-                        {assessment_paragraphs}
-                    </div>
-        </div>
-    </body>
-    </html>
-    """
-
-    # Plain-text fallback
-    body_text = (
-        f"Daily summary for {user_id}\nDate: {date or 'All time'}\n\n"
-        f"Analyses: {agg.get('count')}\n"
-        f"Avg sentiment: {avg_comp_str} ({sentiment_label})\n"
-        f"Risk hits: {risk_total} (top: {top_risk or 'None'} {top_risk_count})\n"
-        f"Risk counts: {', '.join([f'{k}={v}' for k,v in risk_counts.items()])}\n\n"
-        f"Aggregated: {agg}\n\nAssessment:\n{assessment_plain}"
+            iv = 0
+        risk_total += iv
+        if iv > top_risk_count:
+            top_risk, top_risk_count = k, iv
+        risk_parts.append(f"{k}={v}")
+
+    # The assessment arrives fully rendered from _render_assessment
+    assessment_paragraphs = mh.get('assessment') or ''
+    assessment_plain = mh.get('assessment_plain') or ''
+
+    html = _SUMMARY_EMAIL_TMPL.substitute(
+        user_id=safe_uid,
+        date_label=escape(date) if date else 'All time',
+        count=agg.get('count'),
+        avg_comp_str=avg_comp_str,
+        sentiment_label=sentiment_label,
+        risk_total=risk_total,
+        top_risk=escape(str(top_risk)) if top_risk else 'None',
+        top_risk_count=top_risk_count,
+        badges_html=badges_html,
+        risk_rows=risk_rows,
+        assessment_paragraphs=assessment_paragraphs,
     )
 
-    payload = {
-            "personalizations": [{"to": [{"email": send_to}], "subject": subject}],
+    # Plain-text fallback, assembled in one join pass
+    body_text = "\n".join([
+        f"Daily summary for {user_id}",
+        f"Date: {date or 'All time'}",
+        "",
+        f"Analyses: {agg.get('count')}",
+        f"Avg sentiment: {avg_comp_str} ({sentiment_label})",
+        f"Risk hits: {risk_total} (top: {top_risk or 'None'} {top_risk_count})",
+        f"Risk counts: {', '.join(risk_parts)}",
+        "",
+        f"Aggregated: {agg}",
+        "",
+        "Assessment:",
+        assessment_plain,
+    ])
+
+    return {
+            "personalizations": [{"to": [{"email": user_id}], "subject": subject}],
             "from": {"email": send_from},
             "content": [
                     {"type": "text/plain", "value": body_text},
@@ -710,25 +894,166 @@ def email_summary(user_id: str, date: str = Body(None, embed=True)):
             ],
     }
 
-    message = Mail(
-        from_email=send_from,
-        to_emails=send_to,
-        subject="Safe Chat AI Summary",
-        plain_text_content=body_text,
-        html_content=html,
-    )
 
+@functools.lru_cache(maxsize=4)
+def _sendgrid_headers(key: str) -> dict:
+    """Request headers for a SendGrid key, built once per key."""
+    return {"Authorization": f"Bearer {key}", "Content-Type": "application/json"}
+
+
+def _sendgrid_request_kwargs(payload: dict, sendgrid_key: str) -> dict:
+    """Body and header kwargs for a SendGrid mail POST.
+
+    orjson serializes the multi-KB HTML payload in C when available;
+    otherwise fall back to httpx's stdlib json encoding.
+    """
+    headers = _sendgrid_headers(sendgrid_key)
+    if orjson is not None:
+        return {"content": orjson.dumps(payload), "headers": headers}
+    return {"json": payload, "headers": headers}
+
+
+async def _send_via_sendgrid(payload: dict, sendgrid_key: str) -> int:
+    """POST a mail payload to SendGrid's REST endpoint on the shared async
+    client; the SDK's blocking send would pin the event loop for the whole
+    round trip. Returns the SendGrid status code or raises HTTPException."""
     try:
-        sg = SendGridAPIClient(sendgrid_key)
-        resp = sg.send(message)
+        resp = await _http_client().post(
+            "https://api.sendgrid.com/v3/mail/send",
+            **_sendgrid_request_kwargs(payload, sendgrid_key),
+        )
         status = resp.status_code
-        body = getattr(resp, 'body', None)
-        headers = getattr(resp, 'headers', None)
+        body = resp.text
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"SendGrid SDK error: {e}")
+        raise HTTPException(status_code=500, detail=f"SendGrid request error: {e}")
 
     if status >= 400:
         raise HTTPException(status_code=500, detail=f"SendGrid error: {status} {body}")
+    return status
+
+
+async def _send_summary_email_bg(payload: dict, sendgrid_key: str, user_id: str):
+    """Background wrapper around _send_via_sendgrid: the response has already
+    gone out, so failures are logged instead of raised."""
+    try:
+        await _send_via_sendgrid(payload, sendgrid_key)
+    except HTTPException as e:
+        logger.warning("summary email to %s failed: %s", user_id, e.detail)
+
+
+@app.post("/email_summary/{user_id}")
+async def email_summary(background_tasks: BackgroundTasks, user_id: str, date: str = Body(None, embed=True), force: int = Query(0, description="Set to 1 to bypass the assessment cache")):
+    """Compose the mental health assessment and email it using SendGrid.
+
+    Requires SENDGRID_API_KEY and SENDGRID_FROM environment variables.
+    The user_id is used as the email recipient.
+    """
+    # Fail fast on missing credentials before paying for the LLM call and
+    # body rendering
+    sendgrid_key = SENDGRID_API_KEY
+    send_from = SENDGRID_FROM
+    send_to = user_id  # Use user_id directly as email recipient
 
-    return {"status": "sent", "to": send_to, "sg_status": status}
+    if not sendgrid_key or not send_from or not send_to:
+            raise HTTPException(status_code=400, detail="SENDGRID_API_KEY and SENDGRID_FROM must be set")
+
+    # build the assessment
+    try:
+        mh = await _build_mental_health(user_id, date=date, use_cache=not force)
+    except HTTPException as e:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    # Hand the ~200ms SendGrid round trip to a background task so the caller
+    # isn't held on network I/O; failures land in the log
+    payload = _compose_summary_email(user_id, date, mh, send_from)
+    background_tasks.add_task(_send_summary_email_bg, payload, sendgrid_key, user_id)
+    return {"status": "queued", "to": send_to}
+
+
+# Cap on simultaneous in-flight LLM/SendGrid requests during batch jobs
+BATCH_MAX_CONCURRENCY = int(os.environ.get("BATCH_MAX_CONCURRENCY", "10"))
+
+
+@app.post("/email_summary_batch")
+async def email_summary_batch(date: str = Body(..., embed=True), use_batch_llm: bool = Body(True, embed=True)):
+    """Run the daily summary email for every user active on a date.
+
+    Aggregates each user's metrics in-process, then issues one batched LLM
+    call covering all users (set use_batch_llm=false to fall back to per-user
+    calls overlapped with asyncio.gather) and dispatches the SendGrid emails
+    concurrently. Returns per-user success/error results.
+    """
+    sendgrid_key = SENDGRID_API_KEY
+    send_from = SENDGRID_FROM
+    if not sendgrid_key or not send_from:
+        raise HTTPException(status_code=400, detail="SENDGRID_API_KEY and SENDGRID_FROM must be set")
+
+    try:
+        user_ids = get_user_ids_for_date(date)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    if not user_ids:
+        return {"date": date, "count": 0, "results": {}}
+
+    per_user = {uid: _aggregate_user(uid, date) for uid in user_ids}
+
+    # Bound the fan-out: unbounded gather over hundreds of users would open
+    # that many LLM/SendGrid requests at once and trip provider rate limits.
+    sem = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+
+    async def _bounded(coro):
+        async with sem:
+            return await coro
+
+    if use_batch_llm:
+        try:
+            assessments = await uplevel_mental_health_assessment_batch_async(
+                {uid: agg for uid, (agg, _themes) in per_user.items()}
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"LLM error: {e}")
+    else:
+        outcomes = await asyncio.gather(
+            *[_bounded(uplevel_mental_health_assessment_async(agg, themes, user_id=uid))
+              for uid, (agg, themes) in per_user.items()],
+            return_exceptions=True,
+        )
+        assessments = dict(zip(per_user, outcomes))
+
+    async def _send_one(uid: str, aggregated: dict):
+        text = assessments.get(uid)
+        if isinstance(text, Exception):
+            return {"status": "error", "detail": f"LLM error: {text}"}
+        if not text or not text.strip():
+            # the batch response omitted this user; don't mail a summary
+            # whose assessment section is blank
+            return {"status": "error", "detail": "no assessment returned for user"}
+        assessment_html, assessment_plain = _render_assessment(text)
+        mh = {
+            "user_id": uid,
+            "date": date,
+            "aggregated": aggregated,
+            "assessment": assessment_html,
+            "assessment_plain": assessment_plain,
+        }
+        payload = _compose_summary_email(uid, date, mh, send_from)
+        status = await _send_via_sendgrid(payload, sendgrid_key)
+        return {"status": "sent", "sg_status": status}
+
+    sent = await asyncio.gather(
+        *[_bounded(_send_one(uid, agg)) for uid, (agg, _themes) in per_user.items()],
+        return_exceptions=True,
+    )
+
+    results = {}
+    for uid, outcome in zip(per_user, sent):
+        if isinstance(outcome, HTTPException):
+            results[uid] = {"status": "error", "detail": outcome.detail}
+        elif isinstance(outcome, Exception):
+            results[uid] = {"status": "error", "detail": str(outcome)}
+        else:
+            results[uid] = outcome
+    return {"date": date, "count": len(results), "results": results}
 
@@ -0,0 +1,12 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+
+
+@pytest.fixture(scope="session")
+def client():
+    # One client (and one app startup/shutdown) shared across the whole run;
+    # building the middleware stack per test dominates endpoint-test time.
+    with TestClient(app) as c:
+        yield c
@@ -1,10 +1,4 @@
-from fastapi.testclient import TestClient
-from main import app
-
-client = TestClient(app)
-
-
-def test_summary_endpoint():
+def test_summary_endpoint(client):
     user_id = "user123"
     resp = client.get(f"/summary/{user_id}")
     assert resp.status_code == 200
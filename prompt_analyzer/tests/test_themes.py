@@ -1,13 +1,16 @@
 from app.analysis import extract_themes
 
+# Built once at collection; re-joining per test matters once this gets
+# parametrized, and identical text lets extract_themes cache hits land.
+_SNIPPETS = (
+    "I feel sad and alone",
+    "There is bullying at school",
+    "I feel sad about school",
+)
+_TEXT = " \n ".join(_SNIPPETS)
+
 
 def test_extract_themes_fallback():
-    snippets = [
-        "I feel sad and alone",
-        "There is bullying at school",
-        "I feel sad about school",
-    ]
-    text = " \n ".join(snippets)
-    themes = extract_themes(text, top_k=3)
+    themes = extract_themes(_TEXT, top_k=3)
     # themes should include 'sad' or 'school' depending on extraction
     assert any(t in themes for t in ("sad", "school"))